@@ -6,11 +6,18 @@ This provides a focused analysis of our most effective attacks.
 
 import json
 import os
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import argparse
 
+# orjson is optional; it parses the log several times faster than the json module
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
 def analyze_top_attacks_results(log_file='top_attacks_results.jsonl', output_prefix='top_attacks'):
     """
     Analyze the results of the top attacks experiment.
@@ -27,13 +34,14 @@ def analyze_top_attacks_results(log_file='top_attacks_results.jsonl', output_pre
     
     # Load the log data
     try:
-        with open(log_file, 'r') as f:
+        # Lines stay bytes; both parsers accept UTF-8 directly
+        with open(log_file, 'rb') as f:
             entries = []
             for line in f:
                 if not line.strip():
                     continue
                 try:
-                    entries.append(json.loads(line))
+                    entries.append(_json_loads(line))
                 except json.JSONDecodeError as e:
                     print(f"Warning: Skipping invalid JSON line: {e}")
     except Exception as e:
@@ -46,66 +54,61 @@ def analyze_top_attacks_results(log_file='top_attacks_results.jsonl', output_pre
         
     print(f"Found {len(entries)} test results to analyze.")
     
-    # First, find baseline output length for each model and prompt type
-    baseline_lengths = {}
+    # Flatten successful results into one table so the effectiveness maths runs vectorized
+    rows = []
     for entry in entries:
-        if entry.get('status') == 'success' and entry['attack_details']['type'] == 'none':
-            model = entry.get('model', 'unknown')
-            prompt_type = entry.get('prompt_type', 'unknown')
-            if 'test_run_output' in entry and 'analysis' in entry['test_run_output']:
-                output_length = entry['test_run_output']['analysis'].get('image_output_length', 0)
-                baseline_lengths[(model, prompt_type)] = output_length
+        if entry.get('status') != 'success':
+            continue
+        if 'test_run_output' not in entry or 'analysis' not in entry['test_run_output']:
+            continue
+        analysis = entry['test_run_output']['analysis']
+        rows.append({
+            'attack_name': entry['attack_details']['name'],
+            'attack_type': entry['attack_details']['type'],
+            'model': entry.get('model', 'unknown'),
+            'prompt_type': entry.get('prompt_type', 'unknown'),
+            'output_length': analysis.get('image_output_length', 0),
+            'is_failed': analysis.get('image_test_failed', False)
+        })
+    
+    if not rows:
+        print("No attack data available for analysis.")
+        return
+    
+    results = pd.DataFrame(rows)
+    
+    # First, find baseline output length for each model and prompt type
+    is_baseline = results['attack_type'] == 'none'
+    baselines = (results.loc[is_baseline, ['model', 'prompt_type', 'output_length']]
+                 .drop_duplicates(subset=['model', 'prompt_type'], keep='last')
+                 .rename(columns={'output_length': 'baseline_length'}))
+    baseline_lengths = {(model, prompt_type): int(length) for model, prompt_type, length
+                        in baselines.itertuples(index=False)}
     
     print(f"Baseline output lengths: {baseline_lengths}")
     
     # Now analyze each attack's effectiveness relative to its baseline
-    attack_data = []
+    df = results.loc[~is_baseline].merge(baselines, on=['model', 'prompt_type'], how='left')
+    df['baseline_length'] = df['baseline_length'].fillna(0).astype(np.int64)
+    
+    missing = df['baseline_length'] == 0
+    for model, prompt_type in df.loc[missing, ['model', 'prompt_type']].drop_duplicates().itertuples(index=False):
+        print(f"Warning: No baseline found for {model}, {prompt_type}")
+    df = df.loc[~missing].reset_index(drop=True)
+    
+    # Calculate relative reduction in output (effectiveness)
+    output_length = df['output_length'].to_numpy()
+    baseline_length = df['baseline_length'].to_numpy()
+    is_failed = df['is_failed'].to_numpy(dtype=bool)
+    df['length_reduction'] = baseline_length - output_length
+    
+    # If test failed entirely (no output), that's maximum effectiveness
+    df['effectiveness'] = np.where(is_failed | (output_length == 0), 100.0,
+                                   df['length_reduction'].to_numpy() / baseline_length * 100)
+    
+    df = df[['attack_name', 'attack_type', 'model', 'prompt_type', 'output_length',
+             'baseline_length', 'length_reduction', 'effectiveness', 'is_failed']]
     
-    for entry in entries:
-        if entry.get('status') != 'success':
-            continue
-            
-        attack_name = entry['attack_details']['name']
-        attack_type = entry['attack_details']['type']
-        model = entry.get('model', 'unknown')
-        prompt_type = entry.get('prompt_type', 'unknown')
-        
-        # Skip baseline for effectiveness calculation
-        if attack_type == 'none':
-            continue
-        
-        if 'test_run_output' in entry and 'analysis' in entry['test_run_output']:
-            output_length = entry['test_run_output']['analysis'].get('image_output_length', 0)
-            is_failed = entry['test_run_output']['analysis'].get('image_test_failed', False)
-            
-            # Get corresponding baseline length
-            baseline_length = baseline_lengths.get((model, prompt_type), 0)
-            if baseline_length == 0:
-                print(f"Warning: No baseline found for {model}, {prompt_type}")
-                continue
-            
-            # Calculate relative reduction in output (effectiveness)
-            length_reduction = baseline_length - output_length
-            effectiveness = (length_reduction / baseline_length) * 100
-            
-            # If test failed entirely (no output), that's maximum effectiveness
-            if is_failed or output_length == 0:
-                effectiveness = 100
-            
-            attack_data.append({
-                'attack_name': attack_name,
-                'attack_type': attack_type,
-                'model': model,
-                'prompt_type': prompt_type,
-                'output_length': output_length,
-                'baseline_length': baseline_length,
-                'length_reduction': length_reduction,
-                'effectiveness': effectiveness,
-                'is_failed': is_failed
-            })
-    
-    # Convert to DataFrame for easier analysis
-    df = pd.DataFrame(attack_data)
     if df.empty:
         print("No attack data available for analysis.")
         return
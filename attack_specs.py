@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Loader for the canonical attack recipes in attacks/*.json, shared by the PDF
+generation scripts, plus a content-addressed cache of compiled attack PDFs.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import functools
+import tempfile
+
+import exam_attack_v3
+from exam_attack_v3 import create_exam_variant
+
+# Compiled PDFs keyed by attack recipe + template + generator source
+PDF_CACHE_DIR = '.pdf_cache'
+
+# Attack recipes live as data under attacks/: recipes.json holds every recipe,
+# the other files list recipe names (or inline recipes) for one attack set
+ATTACKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'attacks')
+RECIPES_PATH = os.path.join(ATTACKS_DIR, 'recipes.json')
+EX1_ATTACKS_PATH = os.path.join(ATTACKS_DIR, 'ex1_top10.json')
+TOP_ATTACKS_PATH = os.path.join(ATTACKS_DIR, 'top10.json')
+
+def _index_recipes(recipes):
+    """Index recipes by name, failing fast on a duplicated name."""
+    attacks = {}
+    for attack in recipes:
+        if attack['name'] in attacks:
+            raise ValueError(f"Duplicate attack name in {RECIPES_PATH}: {attack['name']}")
+        attacks[attack['name']] = attack
+    return attacks
+
+with open(RECIPES_PATH, 'r') as f:
+    ATTACKS = _index_recipes(json.load(f))
+
+BASELINE = ATTACKS['baseline_clean']
+
+def load_attacks(path):
+    """
+    Load an attack set from a JSON list.
+    
+    Each entry is either the name of a recipe in attacks/recipes.json or a full
+    attack dict ({'name': ..., 'type': ..., 'params': ...}).
+    
+    Args:
+        path (str): Path to the JSON attack list
+        
+    Returns:
+        list: Attack dicts ready for create_exam_variant
+    """
+    with open(path, 'r') as f:
+        entries = json.load(f)
+    attacks = [ATTACKS[entry] if isinstance(entry, str) else entry for entry in entries]
+    
+    # Variants are written to variant_<name>.*, so two attacks with one name would collide
+    names = [attack['name'] for attack in attacks]
+    if len(set(names)) != len(names):
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        raise ValueError(f"Duplicate attack names in {path}: {', '.join(duplicates)}")
+    return attacks
+
+# Sample set for ex1_shorter.tex physical testing (baseline first)
+EX1_ATTACKS = load_attacks(EX1_ATTACKS_PATH)
+
+# Top 10 most effective attacks from previous experiments (baseline not included)
+TOP_ATTACKS = load_attacks(TOP_ATTACKS_PATH)
+
+@functools.lru_cache(maxsize=16)
+def _file_digest(path, mtime_ns):
+    """sha256 of a file's bytes; the mtime argument invalidates the cache on edits."""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).digest()
+
+def _build_key(attack, template_path, build_id, deps=()):
+    """
+    Hash the attack recipe, build procedure, template, generator source and the source
+    files in deps (e.g. the script defining a custom build) into a cache key.
+    """
+    digest = hashlib.sha256(json.dumps([attack, build_id], sort_keys=True).encode('utf-8'))
+    # Every attack shares the same template and sources, so those are hashed once per run
+    for path in (template_path, exam_attack_v3.__file__, *deps):
+        digest.update(_file_digest(path, os.stat(path).st_mtime_ns))
+    return digest.hexdigest()
+
+def _is_newer(path, deps):
+    """Return True if path exists and is newer than every file in deps (make-style)."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return False
+    return all(mtime > os.path.getmtime(dep) for dep in deps)
+
+def _read_build_key(key_path):
+    """Return the build key recorded in a {output_name}.build_key sidecar, or None."""
+    try:
+        with open(key_path, 'r') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def cached_build(attack, template_path, output_name, build=None, cache_dir=PDF_CACHE_DIR,
+                 force=False, deps=(), build_id=None):
+    """
+    Build {output_name}.pdf for an attack, reusing a previously compiled PDF when the
+    attack recipe, template and generator are unchanged.
+    
+    An existing output PDF is left as is when it is newer than the template, the generator
+    sources and deps, and its {output_name}.build_key sidecar records the same build key
+    (so a PDF built from another template or recipe is never mistaken for up to date);
+    force=True skips both that check and the PDF cache.
+
+    Args:
+        attack (dict): Attack parameters as passed to create_exam_variant
+        template_path (str): Path to the LaTeX template
+        output_name (str): Output path without extension
+        build (callable): build(attack, template_path, output_name) -> PDF path, or None
+            if the build failed; defaults to create_exam_variant
+        cache_dir (str): Directory holding the cached PDFs
+        force (bool): Always recompile, ignoring existing and cached PDFs
+        deps (iterable): Extra source files the output depends on, e.g. the calling script
+            that defines build; their contents are part of the cache key
+        build_id (str): Names the build procedure when build is given (e.g. its number of
+            lualatex passes), so PDFs from different procedures are cached apart
+
+    Returns:
+        str or None: Path to the PDF, or None if the build failed; a returned path always exists
+    """
+    pdf_path = f"{output_name}.pdf"
+    key_path = f"{output_name}.build_key"
+    deps = tuple(deps)
+    key = _build_key(attack, template_path, build_id or 'create_exam_variant', deps)
+    # mtimes are the cheap pre-check; the recorded key confirms what the PDF was built from
+    if (not force and _is_newer(pdf_path, [template_path, exam_attack_v3.__file__, __file__, RECIPES_PATH, *deps])
+            and _read_build_key(key_path) == key):
+        print(f"Up to date, skipping {attack['name']}: {pdf_path}")
+        return pdf_path
+
+    cached_pdf = os.path.join(cache_dir, f"{key}.pdf")
+
+    if not force and os.path.exists(cached_pdf):
+        print(f"Using cached PDF for {attack['name']} ({key[:12]})")
+        shutil.copyfile(cached_pdf, pdf_path)
+        with open(key_path, 'w') as f:
+            f.write(key)
+        return pdf_path
+
+    # A failed build must not leave the previous PDF behind to be mistaken for its output;
+    # forcing also drops the .tex hash sidecar that lets _compile_tex skip a compile
+    stale_paths = [pdf_path, key_path]
+    if force:
+        stale_paths.append(f"{output_name}.key")
+    for stale_path in stale_paths:
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+
+    if build is None:
+        pdf_path = create_exam_variant(template_path=template_path, output_name=output_name,
+                                       attack_params=attack)
+    else:
+        pdf_path = build(attack, template_path, output_name)
+    if not pdf_path or not os.path.exists(pdf_path):
+        return None
+
+    # Archive the result; the tmp + rename keeps concurrent workers from seeing a partial PDF
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    os.close(fd)
+    shutil.copyfile(pdf_path, tmp_path)
+    os.replace(tmp_path, cached_pdf)
+    with open(os.path.join(cache_dir, f"{key}.json"), 'w') as f:
+        json.dump({'attack': attack, 'template': template_path, 'build': build_id or 'create_exam_variant'},
+                  f, indent=2)
+    with open(key_path, 'w') as f:
+        f.write(key)
+    return pdf_path
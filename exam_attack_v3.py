@@ -4,14 +4,39 @@ import os
 import subprocess
 import re
 import shutil
+import hashlib
+import json
+import functools
+import tempfile
+from dataclasses import dataclass
 
-def get_preamble_code(attack_params: dict) -> str:
-    """Generates LaTeX code for the preamble based on the attack type."""
-    attack_type = attack_params.get('type', 'none')
-    params = attack_params.get('params', {})
-    code = ""
+# Resolved once at import: lualatex from PATH, with fallback to the common TeX Live location
+LUALATEX_PATH = shutil.which('lualatex') or '/usr/local/texlive/2025/bin/universal-darwin/lualatex'
+
+# Options for every lualatex run: only the PDF is consumed, so no SyncTeX data, and
+# the generated variants never need to run shell commands
+LUALATEX_OPTIONS = ['-synctex=0', '-no-shell-escape']
+
+# Latin characters and their look-alike replacements for the homoglyph attack
+HOMOGLYPH_TABLE = str.maketrans({
+    'a': 'а', 'e': 'е', 'o': 'о', 'c': 'с', # Cyrillic
+    'l': 'I', 'I': 'l',
+})
+
+# Common LaTeX errors worth pointing out from a failed compile log
+_LATEX_ERROR_RE = re.compile(rb'Undefined control sequence|Missing|File not found|Emergency stop')
+
+# Markers in the exam templates that receive the generated code
+_PLACEHOLDER_RE = re.compile(r'%%(WATERMARK_AREA|TRAP_QUESTION_AREA)%%')
+
+# Escaped characters and braces, for checking brace balance in generated preamble code
+_BRACE_TOKEN_RE = re.compile(r'\\.|[{}]')
 
-    dimension_setup = r"""
+# Attack types that rewrite the document body (all others only add preamble code)
+_BODY_ATTACKS = frozenset({'kerning', 'symbol_stretch', 'font_swap', 'homoglyph', 'ligature', 'low_contrast'})
+
+# Page dimension setup shared by the TikZ background attacks; may only appear once per document
+DIMENSION_SETUP = r"""
 \usepackage{layouts}
 \usepackage{atbegshi}
 
@@ -23,15 +48,80 @@ def get_preamble_code(attack_params: dict) -> str:
 }
 """
 
-    if attack_type in ['watermark_tiled', 'texture']:
-        code += dimension_setup
+# Page background wrapper for the TikZ attacks; body is the pre-expanded drawing commands
+_TIKZ_BACKGROUND_TPL = r"""
+\AddToShipoutPictureBG{{%
+  \begin{{tikzpicture}}[remember picture, overlay]
+{body}
+  \end{{tikzpicture}}%
+}}"""
+
+# Pre-rendered texture backgrounds, keyed by a hash of the TikZ drawing
+TEXTURE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'textures_cache')
+
+# Standalone document for pre-rendering a texture. The bounding box starts 1mm outside the
+# page origin so strokes on the edges are kept, and covers a whole A4 or US letter page:
+# like the inline overlay, whatever lies past the page edge is only clipped at shipout
+_TEXTURE_STANDALONE_TPL = r"""\documentclass{{standalone}}
+\usepackage{{tikz}}
+\begin{{document}}
+\begin{{tikzpicture}}
+  \useasboundingbox (-1mm,-1mm) rectangle (22,30);
+{body}
+\end{{tikzpicture}}
+\end{{document}}
+"""
+
+# Page background placing a pre-rendered texture where the TikZ overlay would have drawn it;
+# the path is quoted so a checkout directory containing spaces still works
+_TEXTURE_INCLUDE_TPL = r"""
+\usepackage{{graphicx}}
+\AddToShipoutPictureBG{{%
+  \AtPageLowerLeft{{\kern-1mm\raisebox{{-1mm}}{{\includegraphics{{"{path}"}}}}}}%
+}}"""
+
+# Texture backgrounds that failed to pre-render in this run; those are drawn inline
+_FAILED_TEXTURES = set()
+
+# Attack types whose preamble starts with DIMENSION_SETUP
+_NEEDS_DIMENSION_SETUP = frozenset({'watermark_tiled', 'texture'})
+
+# Preamble code already generated for identical attack parameters
+_PREAMBLE_CACHE = {}
+
+@functools.lru_cache(maxsize=8)
+def _read_template(template_path: str, mtime_ns: int) -> str:
+    """Reads a template file; the mtime argument invalidates the cache on edits."""
+    with open(template_path, 'r') as f:
+        return f.read()
+
+def get_preamble_code(attack_params: dict, include_setup: bool = True) -> str:
+    """
+    Generates LaTeX code for the preamble based on the attack type.
+    include_setup=False leaves out DIMENSION_SETUP, for combos that already emitted it.
+    """
+    cache_key = (include_setup, json.dumps(attack_params, sort_keys=True, default=str))
+    code = _PREAMBLE_CACHE.get(cache_key)
+    if code is None:
+        code = _build_preamble_code(attack_params, include_setup)
+        _PREAMBLE_CACHE[cache_key] = code
+    return code
+
+def _build_preamble_code(attack_params: dict, include_setup: bool = True) -> str:
+    """Builds the preamble code for get_preamble_code."""
+    attack_type = attack_params.get('type', 'none')
+    params = attack_params.get('params', {})
+    parts = []
+
+    if include_setup and attack_type in _NEEDS_DIMENSION_SETUP:
+        parts.append(DIMENSION_SETUP)
 
     if attack_type == 'watermark':
         text = params.get('text', 'EXAM COPY')
         color = params.get('color', 'gray!10')
         angle = params.get('angle', 45)
         size = params.get('size', 5)
-        code += fr"""
+        parts.append(fr"""
 \usepackage{{eso-pic}}
 \AddToShipoutPictureBG{{%
   \AtPageCenter{{%
@@ -42,7 +132,7 @@ def get_preamble_code(attack_params: dict) -> str:
     }}%
   }}%
 }}
-"""
+""")
 
     elif attack_type == 'watermark_tiled':
         text = params.get('text', 'WATERMARK')
@@ -51,59 +141,21 @@ def get_preamble_code(attack_params: dict) -> str:
         angle = params.get('angle', 30)
         x_step = params.get('x_step', 5)
         y_step = params.get('y_step', 4)
-        code += fr"""
-\AddToShipoutPictureBG{{%
-  \begin{{tikzpicture}}[remember picture, overlay]
-    \foreach \x in {{1,{x_step+1},...,20}} {{
-      \foreach \y in {{1,{y_step+1},...,28}} {{
-        \node[rotate={angle}, color={color}, anchor=center] at (\x cm, \y cm) {{\fontsize{{{size}}}{{{size+2}}}\selectfont ${text}$}};
-      }}
-    }}
-  \end{{tikzpicture}}%
-}}
-"""
+        nodes = "\n".join(
+            fr"    \node[rotate={angle}, color={color}, anchor=center] at ({x:g}cm, {y:g}cm) {{\fontsize{{{size}}}{{{size+2}}}\selectfont ${text}$}};"
+            for x in _tile_coordinates(1, x_step, 20)
+            for y in _tile_coordinates(1, y_step, 28)
+        )
+        parts.append(_TIKZ_BACKGROUND_TPL.format(body=nodes) + "\n")
     elif attack_type == 'texture':
-        pattern = params.get('pattern', 'dots')
-        density = params.get('density', 0.7)
-        color = params.get('color', 'gray!10')
-        step = 2.0 / density if density > 0 else 2.0
-        line_width = params.get('line_width', 'thin')
-        
-        if pattern == 'dots':
-            code += fr"""
-\AddToShipoutPictureBG{{%
-  \begin{{tikzpicture}}[remember picture, overlay]
-    \foreach \x in {{0,{step},...,20}} {{
-      \foreach \y in {{0,{step},...,28}} {{
-        \node[circle, fill={color}, inner sep=0.2pt] at (\x cm, \y cm) {{}};
-      }}
-    }}
-  \end{{tikzpicture}}%
-}}"""
-        elif pattern == 'lines':
-            code += fr"""
-\AddToShipoutPictureBG{{%
-  \begin{{tikzpicture}}[remember picture, overlay]
-    \foreach \x in {{0,{step},...,20}} {{\draw[{color}, thin] (\x,0) -- (\x,28);}}
-    \foreach \y in {{0,{step},...,28}} {{\draw[{color}, thin] (0,\y) -- (20,\y);}}
-  \end{{tikzpicture}}%
-}}"""
-        elif pattern == 'wave':
-            code += fr"""
-\AddToShipoutPictureBG{{%
-  \begin{{tikzpicture}}[remember picture, overlay]
-    \foreach \i in {{0,1,...,20}} {{
-      \draw[{color}, thin] plot[domain=0:20, samples=100, smooth] (\x, {{\i*{step} + 0.1*sin(90*\x)}});
-    }}
-  \end{{tikzpicture}}%
-}}"""
-        elif pattern == 'grid':
-            code += fr"""
-\AddToShipoutPictureBG{{%
-  \begin{{tikzpicture}}[remember picture, overlay]
-    \draw[{color}, line width={line_width}pt, step={step}cm] (0,0) grid (20,28);
-  \end{{tikzpicture}}%
-}}"""
+        drawing = _texture_drawing(params)
+        if drawing:
+            # Use the pre-rendered background when prerender_textures has built one
+            texture_pdf = _texture_cache_path(drawing)
+            if os.path.exists(texture_pdf):
+                parts.append(_TEXTURE_INCLUDE_TPL.format(path=texture_pdf.replace(os.sep, '/')))
+            else:
+                parts.append(_TIKZ_BACKGROUND_TPL.format(body=drawing))
 
     elif attack_type == 'font_swap':
         font_name = params.get('font_name', 'Comic Sans MS')
@@ -112,15 +164,114 @@ def get_preamble_code(attack_params: dict) -> str:
         if not safe_name:
             safe_name = "weirdsymbol"
         command_name = f"\\weird{safe_name}"
-        code = fr"""
+        parts.append(fr"""
 \RequirePackage{{fontspec}}
 \newfontfamily\weirdfont{{{font_name}}}[Scale=1.0]
-\newcommand{{{command_name}}}{{{{\\weirdfont {symbol}}}}}
-"""
-    return code
+\newcommand{{{command_name}}}{{{{\weirdfont {symbol}}}}}
+""")
+    return "".join(parts)
 
-def modify_body_content(content: str, attack_params: dict) -> str:
-    """Modifies the body of the LaTeX document for certain attacks."""
+def _texture_drawing(params: dict) -> str:
+    """Builds the TikZ drawing commands for a texture attack (empty for unknown patterns)."""
+    pattern = params.get('pattern', 'dots')
+    density = params.get('density', 0.7)
+    color = params.get('color', 'gray!10')
+    step = 2.0 / density if density > 0 else 2.0
+    line_width = params.get('line_width', 'thin')
+    
+    if pattern == 'dots':
+        return "\n".join(
+            fr"    \node[circle, fill={color}, inner sep=0.2pt] at ({x:g}cm, {y:g}cm) {{}};"
+            for x in _tile_coordinates(0, step, 20)
+            for y in _tile_coordinates(0, step, 28)
+        )
+    elif pattern == 'lines':
+        return "\n".join(
+            [fr"    \draw[{color}, thin] ({x:g},0) -- ({x:g},28);" for x in _tile_coordinates(0, step, 20)]
+            + [fr"    \draw[{color}, thin] (0,{y:g}) -- (20,{y:g});" for y in _tile_coordinates(0, step, 28)]
+        )
+    elif pattern == 'wave':
+        return "\n".join(
+            fr"    \draw[{color}, thin] plot[domain=0:20, samples=100, smooth] (\x, {{{i * step:g} + 0.1*sin(90*\x)}});"
+            for i in range(21)
+        )
+    elif pattern == 'grid':
+        return fr"    \draw[{color}, line width={line_width}pt, step={step}cm] (0,0) grid (20,28);"
+    return ""
+
+def _texture_cache_path(drawing: str) -> str:
+    """Path of the pre-rendered background PDF for a texture drawing."""
+    digest = hashlib.sha1(drawing.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(TEXTURE_CACHE_DIR, f"texture_{digest}.pdf")
+
+def _iter_texture_params(attack_params: dict):
+    """Yields the params of every texture attack in attack_params, including combo sub-attacks."""
+    if attack_params.get('type') == 'texture':
+        yield attack_params.get('params', {})
+    elif attack_params.get('type') == 'combo':
+        for sub_attack in attack_params.get('params', {}).get('sub_attacks', []):
+            yield from _iter_texture_params(sub_attack)
+
+def prerender_textures(attack_params: dict) -> list:
+    """
+    Renders each texture of an attack once into TEXTURE_CACHE_DIR, so variants include
+    a ready-made background PDF instead of having lualatex draw the TikZ pattern again.
+    Returns the paths of the background PDFs that are available.
+    """
+    rendered = []
+    for params in _iter_texture_params(attack_params):
+        drawing = _texture_drawing(params)
+        if not drawing:
+            continue
+        texture_pdf = _texture_cache_path(drawing)
+        if texture_pdf in _FAILED_TEXTURES:
+            continue
+        if not os.path.exists(texture_pdf):
+            os.makedirs(TEXTURE_CACHE_DIR, exist_ok=True)
+            work_dir = tempfile.mkdtemp(dir=TEXTURE_CACHE_DIR)
+            try:
+                tex_path = os.path.join(work_dir, 'texture.tex')
+                with open(tex_path, 'w') as f:
+                    f.write(_TEXTURE_STANDALONE_TPL.format(body=drawing))
+                process = subprocess.run([LUALATEX_PATH, *LUALATEX_OPTIONS, '-interaction=batchmode',
+                                          '-halt-on-error', '-output-directory', work_dir, tex_path],
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                built_pdf = os.path.join(work_dir, 'texture.pdf')
+                if process.returncode != 0 or not os.path.exists(built_pdf):
+                    print(f"Warning: could not pre-render texture {params}; drawing it inline.")
+                    # Don't retry it for every other variant using the same texture
+                    _FAILED_TEXTURES.add(texture_pdf)
+                    continue
+                os.replace(built_pdf, texture_pdf)
+                # Preamble code generated before this texture existed still draws it inline
+                _PREAMBLE_CACHE.clear()
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        rendered.append(texture_pdf)
+    return rendered
+
+def _tile_coordinates(start: float, step: float, stop: float) -> list:
+    """Expands a TikZ-style {start,start+step,...,stop} list into explicit coordinates."""
+    if step <= 0:
+        return [start]
+    count = int((stop - start) / step + 1e-9) + 1
+    return [start + i * step for i in range(count)]
+
+def _preamble_is_balanced(preamble: str) -> bool:
+    """Checks that unescaped braces in generated preamble code are balanced."""
+    depth = 0
+    for match in _BRACE_TOKEN_RE.finditer(preamble):
+        token = match.group()
+        if token == '{':
+            depth += 1
+        elif token == '}':
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
+
+def get_body_substitution(attack_params: dict) -> tuple[str, str] | None:
+    """Returns the literal (old, new) text substitution a body attack applies, if any."""
     attack_type = attack_params.get('type', 'none')
     params = attack_params.get('params', {})
 
@@ -128,18 +279,18 @@ def modify_body_content(content: str, attack_params: dict) -> str:
         amount = params.get('amount', -0.05)
         if 'target' in params:
             target = params['target']
-            mathPattern = f"${re.escape(target)}$"
+            mathPattern = f"${target}$"
             replacement = f"${target}\\mkern{{{amount}}}em$"
-            return content.replace(mathPattern, replacement)
-        return content
+            return mathPattern, replacement
+        return None
 
     if attack_type == 'symbol_stretch':
         stretch_amount = params.get('stretch_amount', 1.5)
         if 'target' in params:
             target = params['target']
             replacement = f"\\scalebox{{{stretch_amount}}}[1]{{{target}}}"
-            return content.replace(target, replacement)
-        return content
+            return target, replacement
+        return None
 
     if attack_type == 'font_swap':
         symbol = params.get('symbol_to_swap', '+')
@@ -147,20 +298,14 @@ def modify_body_content(content: str, attack_params: dict) -> str:
         if not safe_name:
             safe_name = "weirdsymbol"
         command_name = f"\\weird{safe_name}"
-        return content.replace(symbol, command_name)
+        return symbol, command_name
 
     if attack_type == 'homoglyph':
-        substitutions = {
-            'a': 'а', 'e': 'е', 'o': 'о', 'c': 'с', # Cyrillic
-            'l': 'I', 'I': 'l',
-        }
         target_word = params.get('target', '')
         if target_word:
-            new_word = ""
-            for char in target_word:
-                new_word += substitutions.get(char, char)
-            return content.replace(target_word, new_word)
-        return content
+            new_word = target_word.translate(HOMOGLYPH_TABLE)
+            return target_word, new_word
+        return None
 
     if attack_type == 'ligature':
         # Disrupt common ligatures by inserting a zero-width non-joiner.
@@ -168,112 +313,236 @@ def modify_body_content(content: str, attack_params: dict) -> str:
         if target_word:
             # Using a simple but effective method of breaking ligatures
             replacement = target_word.replace('fi', 'f{{\\kern0pt}}i').replace('fl', 'f{{\\kern0pt}}l')
-            return content.replace(target_word, replacement)
-        return content
+            return target_word, replacement
+        return None
 
     if attack_type == 'low_contrast':
         target_word = params.get('target', '')
         color = params.get('color', 'gray!80')
         if target_word:
             replacement = f"\\textcolor{{{color}}}{{{target_word}}}"
-            return content.replace(target_word, replacement)
+            return target_word, replacement
+        return None
+
+    return None
+
+def _fast_replace(s: str, old: str, new: str) -> str:
+    """Literal replace via split/join; returns s itself when old does not occur."""
+    if not old:
+        return s
+    parts = s.split(old)
+    return new.join(parts) if len(parts) > 1 else s
+
+def modify_body_content(content: str, attack_params: dict) -> str:
+    """Modifies the body of the LaTeX document for certain attacks."""
+    substitution = get_body_substitution(attack_params)
+    if substitution is None:
         return content
+    old, new = substitution
+    if not old or old not in content:
+        return content
+    return _fast_replace(content, old, new)
+
+@dataclass
+class AttackPlan:
+    """
+    An attack configuration resolved once: its preamble code and its literal body
+    substitutions as (old, new) pairs in attack order.
+
+    The substitutions are applied one after another, so a later target is matched in the
+    text left by the earlier replacements, exactly as applying the attacks in turn.
+    """
+    preamble: str
+    substitutions: tuple = ()
+
+def _collect_substitutions(attacks: list) -> tuple:
+    """Returns the (old, new) body substitutions of attacks that rewrite the body, in order."""
+    substitutions = []
+    for attack in attacks:
+        if attack.get('type') not in _BODY_ATTACKS:
+            continue
+        substitution = get_body_substitution(attack)
+        if substitution and substitution[0] and substitution[0] != substitution[1]:
+            substitutions.append(substitution)
+    return tuple(substitutions)
+
+def _combo_preamble(sub_attacks: list) -> str:
+    """Concatenates the sub-attack preambles, emitting the page dimension setup only once."""
+    preamble_parts = []
+    setup_included = False
+    for sub_attack in sub_attacks:
+        needs_setup = sub_attack.get('type') in _NEEDS_DIMENSION_SETUP
+        preamble_parts.append(get_preamble_code(sub_attack, include_setup=needs_setup and not setup_included))
+        setup_included = setup_included or needs_setup
+    return "".join(preamble_parts)
 
+def build_plan(attack_params: dict) -> AttackPlan:
+    """Resolves attack_params (single or combo) into an AttackPlan."""
+    if attack_params.get('type', 'none') == 'combo':
+        sub_attacks = attack_params.get('params', {}).get('sub_attacks', [])
+        return AttackPlan(preamble=_combo_preamble(sub_attacks),
+                          substitutions=_collect_substitutions(sub_attacks))
+    return AttackPlan(preamble=get_preamble_code(attack_params),
+                      substitutions=_collect_substitutions([attack_params]))
+
+def apply_plan(content: str, plan: AttackPlan) -> str:
+    """Applies a plan's body substitutions to content and fills in the template placeholders."""
+    # In attack order, each replacement seeing the text left by the previous ones;
+    # _fast_replace returns early for targets this template lacks
+    for old, new in plan.substitutions:
+        content = _fast_replace(content, old, new)
+
+    # Both placeholders in one pass
+    fills = {'WATERMARK_AREA': plan.preamble, 'TRAP_QUESTION_AREA': ''}
+    content, count = _PLACEHOLDER_RE.subn(lambda match: fills[match.group(1)], content)
+    if count == 0 and plan.preamble:
+        # Template without placeholders: put the attack code at the end of the preamble
+        content = content.replace('\\begin{document}', plan.preamble + '\\begin{document}', 1)
     return content
 
-def create_exam_variant(template_path: str, output_name: str, attack_params: dict) -> str | None:
-    """Creates and compiles a modified LaTeX exam with specified attack parameters."""
-    with open(template_path, 'r') as f:
-        template_content = f.read()
+def link_or_copy(src: str, dst: str) -> str:
+    """
+    shutil.copytree copy_function for mirroring resource directories next to the variants:
+    hardlinks the file, copying it only across filesystems.
+    """
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+    return dst
+
+def _write_if_changed(path: str, content: str) -> bool:
+    """Writes content to path via an atomic replace, skipping identical rewrites."""
+    data = content.encode('utf-8')
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            existing_digest = hashlib.sha1(f.read()).digest()
+        if existing_digest == hashlib.sha1(data).digest():
+            return False
+
+    # Single write of the already-encoded bytes; lualatex never sees a partial file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb', buffering=len(data) + 1) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+def create_exam_variant(template_path: str, output_name: str, attack_params: dict, draft: bool = False) -> str | None:
+    """
+    Creates and compiles a modified LaTeX exam with specified attack parameters.
+    With draft=True lualatex only checks that the variant compiles (no PDF is written)
+    and the .tex path is returned on success.
+    """
+    prerender_textures(attack_params)
+    variant_tex_path = _write_variant_tex(template_path, output_name, attack_params)
+    if variant_tex_path is None:
+        return None
+    return _compile_tex(variant_tex_path, output_name, draft)
+
+def _write_variant_tex(template_path: str, output_name: str, attack_params: dict) -> str | None:
+    """Applies the attack to the template and writes {output_name}.tex, returning its path."""
+    template_content = _read_template(template_path, os.stat(template_path).st_mtime_ns)
 
     # Ensure we're using the entire template file content
     print(f"Template file {template_path} loaded, size: {len(template_content)} bytes")
     print(f"Template starts with: {template_content[:50]}...")
     print(f"Template ends with: {template_content[-50:]}...")
     
-    preamble_mods = ""
-    modified_content = template_content
-    attack_type = attack_params.get('type', 'none')
-
     # Handle output directory correctly
     output_dir = os.path.dirname(output_name)
     if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
     
-    if attack_type == 'combo':
-        params = attack_params.get('params', {})
-        sub_attacks = params.get('sub_attacks', [])
-        for sub_attack in sub_attacks:
-            if sub_attack.get('type') == 'texture' and 'watermark_tiled' in [a.get('type') for a in sub_attacks]:
-                preamble_code = get_preamble_code(sub_attack)
-                if '\\usepackage{layouts}' in preamble_code and '\\usepackage{layouts}' in preamble_mods:
-                    setup_end = preamble_code.find('\\AddToShipoutPictureBG')
-                    if setup_end > 0:
-                        preamble_mods += preamble_code[setup_end:]
-                else:
-                    preamble_mods += preamble_code
-            else:
-                preamble_mods += get_preamble_code(sub_attack)
-        for sub_attack in sub_attacks:
-            modified_content = modify_body_content(modified_content, sub_attack)
-    else:
-        preamble_mods = get_preamble_code(attack_params)
-        modified_content = modify_body_content(modified_content, attack_params)
+    plan = build_plan(attack_params)
+    preamble_mods = plan.preamble
+    final_content = apply_plan(template_content, plan)
 
-    final_content = modified_content.replace('%%WATERMARK_AREA%%', preamble_mods)
-    final_content = final_content.replace('%%TRAP_QUESTION_AREA%%', '')
+    if preamble_mods.strip() and not _preamble_is_balanced(preamble_mods):
+        print(f"!!!!!! Unbalanced braces in generated preamble for {output_name}; skipping compile. !!!!!!")
+        return None
 
     variant_tex_path = f"{output_name}.tex"
-    with open(variant_tex_path, 'w') as f:
-        f.write(final_content)
-
-    print(f"Generated {variant_tex_path}. Compiling...")
-    # Use shutil.which to find lualatex in PATH, with fallback to common locations
-    lualatex_path = shutil.which('lualatex') or '/usr/local/texlive/2025/bin/universal-darwin/lualatex'
-    if not os.path.exists(lualatex_path):
-        print(f"Warning: LuaLaTeX not found at {lualatex_path}. Compilation may fail.")
+    if _write_if_changed(variant_tex_path, final_content):
+        print(f"Generated {variant_tex_path}.")
+    else:
+        print(f"{variant_tex_path} is unchanged.")
+    return variant_tex_path
+
+def _is_up_to_date(pdf_path: str, tex_path: str, key_path: str, build_key: str) -> bool:
+    """True if pdf_path is newer than tex_path and was built from the same .tex content."""
+    try:
+        if os.path.getmtime(pdf_path) < os.path.getmtime(tex_path):
+            return False
+        with open(key_path, 'r') as f:
+            return f.read() == build_key
+    except OSError:
+        return False
+
+def _compile_tex(variant_tex_path: str, output_name: str, draft: bool = False) -> str | None:
+    """
+    Compiles a variant .tex file with lualatex, returning the PDF path on success.
+    The compile is skipped when the PDF is newer than the .tex and the {output_name}.key
+    sidecar records the same .tex content hash. In draft mode lualatex skips writing the
+    PDF and the .tex path is returned instead.
+    """
+    pdf_path = f"{output_name}.pdf"
+    key_path = f"{output_name}.key"
+    with open(variant_tex_path, 'rb') as f:
+        build_key = hashlib.sha1(f.read()).hexdigest()
+    if not draft and _is_up_to_date(pdf_path, variant_tex_path, key_path, build_key):
+        print(f"{pdf_path} is up to date; skipping compile.")
+        return pdf_path
+
+    print(f"Compiling {variant_tex_path}...")
+    if not os.path.exists(LUALATEX_PATH):
+        print(f"Warning: LuaLaTeX not found at {LUALATEX_PATH}. Compilation may fail.")
     
     # Set output directory if it exists
     output_dir = os.path.dirname(variant_tex_path)
-    compile_command = [lualatex_path, '-interaction=nonstopmode']
+    compile_command = [LUALATEX_PATH, *LUALATEX_OPTIONS, '-interaction=nonstopmode']
+    if draft:
+        compile_command.append('-draftmode')
     
     if output_dir:
         compile_command.extend(['-output-directory', output_dir])
     
     compile_command.append(variant_tex_path)
     
-    process = subprocess.run(
-        compile_command,
-        capture_output=True, text=True
-    )
+    # Stream compiler output straight to disk; only the tail is read back on failure
+    error_log_file = f"{output_name}_error.log"
+    with open(error_log_file, 'wb', buffering=1 << 16) as log_f:
+        process = subprocess.run(compile_command, stdout=log_f, stderr=subprocess.STDOUT)
 
     if process.returncode == 0:
-        print(f"Successfully compiled {output_name}.pdf")
-        return f"{output_name}.pdf"
+        os.remove(error_log_file)
+        if draft:
+            print(f"{variant_tex_path} compiles (draft mode, no PDF written)")
+            return variant_tex_path
+        with open(key_path, 'w') as f:
+            f.write(build_key)
+        print(f"Successfully compiled {pdf_path}")
+        return pdf_path
     else:
         print(f"!!!!!! Error compiling {variant_tex_path}. !!!!!!")
         
-        # Save full error log to file for later inspection
-        error_log_file = f"{output_name}_error.log"
-        with open(error_log_file, 'w') as f:
-            f.write(process.stderr)
-        
-        # Print summary of error for immediate feedback
+        # Full error log is already on disk for later inspection
         print(f"Full error log saved to {error_log_file}")
+        with open(error_log_file, 'rb') as f:
+            f.seek(max(0, os.fstat(f.fileno()).st_size - 8192))
+            error_tail = f.read()
         
-        # Find common LaTeX errors
-        common_errors = ["Undefined control sequence", "Missing", "File not found", "Emergency stop"]
-        for error in common_errors:
-            if error in process.stderr:
-                print(f"Found error type: {error}")
-                # Find the line containing this error and a few lines around it
-                error_index = process.stderr.find(error)
-                context_start = max(0, process.stderr.rfind('\n', 0, error_index - 100))
-                context_end = min(len(process.stderr), process.stderr.find('\n', error_index + 100))
-                print(process.stderr[context_start:context_end])
-                break
+        # Find the first common LaTeX error in a single scan
+        match = _LATEX_ERROR_RE.search(error_tail)
+        if match:
+            print(f"Found error type: {match.group().decode()}")
+            # Print the lines around the error
+            context_start = max(0, error_tail.rfind(b'\n', 0, max(0, match.start() - 100)))
+            context_end = error_tail.find(b'\n', match.end() + 100)
+            if context_end < 0:
+                context_end = len(error_tail)
+            print(error_tail[context_start:context_end].decode('utf-8', errors='replace'))
         else:
             # If no common errors found, print the last 500 characters
-            print("Error Log (last part):", process.stderr[-500:])
+            print("Error Log (last part):", error_tail[-500:].decode('utf-8', errors='replace'))
             
         return None
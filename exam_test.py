@@ -10,6 +10,9 @@
 import os
 import subprocess
 import base64
+import io
+import json
+import hashlib
 import ollama
 from pdf2image import convert_from_path
 
@@ -24,6 +27,16 @@ EXPLAIN_PROMPT = "Explain the concept being tested in this document and provide
 
 IMAGE_DPI = 300 # Simulates a decent quality phone camera resolution
 
+# Model replies from earlier runs, keyed by PDF content, model and prompts (opt-in via use_cache)
+RESULTS_CACHE_DIR = '.llm_cache'
+
+# One client for the whole run so every request reuses the same keep-alive connection
+# (honours OLLAMA_HOST like the module-level ollama.chat helper)
+OLLAMA_CLIENT = ollama.Client()
+
+# How long the server keeps the model loaded after each request; covers the gaps between attacks
+OLLAMA_KEEP_ALIVE = '30m'
+
 def check_vision_capability(model_name: str) -> bool:
     """
     Check if a model supports vision by looking at known vision models
@@ -62,6 +75,43 @@ def test_direct_pdf(pdf_path: str, model_name: str, prompt: str) -> str:
         print(f"  [ERROR] An unexpected error occurred during direct PDF test: {e}")
         return f"Error: {e}"
 
+def _render_first_page(pdf_path: str, image_path: str):
+    """
+    Rasterizes the first PDF page and returns it PNG-encoded, or None if the conversion failed.
+    The same bytes are written to image_path for debugging and for the command line fallback.
+    """
+    # Convert the first PDF page to an image (only that page is sent to the model)
+    images = convert_from_path(pdf_path, dpi=IMAGE_DPI, first_page=1, last_page=1)
+    if not images:
+        return None
+    
+    # Encode once (fast zlib level); the same bytes go to disk and to the model
+    buffer = io.BytesIO()
+    images[0].save(buffer, "PNG", compress_level=1)
+    image_bytes = buffer.getvalue()
+    with open(image_path, "wb") as f:
+        f.write(image_bytes)
+    print(f"  [INFO] Image saved to {image_path} ({images[0].size})")
+    return image_bytes
+
+def _vision_prompt(prompt: str) -> str:
+    """Enhanced prompt for vision models."""
+    return f"{prompt} I am providing you with an image of a document. Please analyze the visual content of this image."
+
+def _run_cli_fallback(model_name: str, vision_prompt: str, image_path: str, api_error: Exception) -> str:
+    """Retries a failed vision API call through the ollama command line."""
+    try:
+        print("  [INFO] Trying command line approach...")
+        cmd = ['ollama', 'run', model_name, f"{vision_prompt}: {image_path}"]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode == 0:
+            print("  [SUCCESS] Image test completed via command line.")
+            return result.stdout.strip()
+        else:
+            return f"Error: Command line approach failed: {result.stderr}"
+    except Exception as cmd_error:
+        return f"Error: All approaches failed. API error: {api_error}. Command line error: {cmd_error}"
+
 def test_image_from_pdf(pdf_path: str, model_name: str, prompt: str) -> str:
     """
     Tests the AI by converting the PDF to an image first.
@@ -74,27 +124,25 @@ def test_image_from_pdf(pdf_path: str, model_name: str, prompt: str) -> str:
     temp_image_path = "temp_exam_page_for_testing.png"
     
     try:
-        # 1. Convert PDF to image
-        images = convert_from_path(pdf_path, dpi=IMAGE_DPI)
-        if not images:
+        # 1. Convert the first PDF page to an encoded image
+        image_bytes = _render_first_page(pdf_path, temp_image_path)
+        if image_bytes is None:
             return "Error: pdf2image failed to convert the PDF."
         
-        images[0].save(temp_image_path, "PNG")
-        print(f"  [INFO] Image saved to {temp_image_path} ({images[0].size})")
-        
         # 2. Enhanced prompt for vision models
-        vision_prompt = f"{prompt} I am providing you with an image of a document. Please analyze the visual content of this image."
+        vision_prompt = _vision_prompt(prompt)
         
         # 3. Call Ollama with the image - using the working format for gemma3:4b
         try:
             # Using the format that's confirmed to work with gemma3:4b
-            response = ollama.chat(
+            response = OLLAMA_CLIENT.chat(
                 model=model_name,
                 messages=[{
                     'role': 'user',
                     'content': vision_prompt,
-                    'images': [temp_image_path]  # Pass the image path directly
-                }]
+                    'images': [image_bytes]  # Pass the encoded image directly
+                }],
+                keep_alive=OLLAMA_KEEP_ALIVE
             )
             print("  [SUCCESS] Image test completed.")
             return response['message']['content']
@@ -102,17 +150,7 @@ def test_image_from_pdf(pdf_path: str, model_name: str, prompt: str) -> str:
             print(f"  [WARNING] Vision API failed with {model_name}: {api_error}")
             
             # Try command line approach as fallback
-            try:
-                print("  [INFO] Trying command line approach...")
-                cmd = ['ollama', 'run', model_name, f"{vision_prompt}: {temp_image_path}"]
-                result = subprocess.run(cmd, capture_output=True, text=True)
-                if result.returncode == 0:
-                    print("  [SUCCESS] Image test completed via command line.")
-                    return result.stdout.strip()
-                else:
-                    return f"Error: Command line approach failed: {result.stderr}"
-            except Exception as cmd_error:
-                return f"Error: All approaches failed. API error: {api_error}. Command line error: {cmd_error}"
+            return _run_cli_fallback(model_name, vision_prompt, temp_image_path, api_error)
 
     except Exception as e:
         print(f"  [ERROR] An unexpected error occurred during image test: {e}")
@@ -124,15 +162,100 @@ def test_image_from_pdf(pdf_path: str, model_name: str, prompt: str) -> str:
             # If you want to automatically clean up, uncomment the code below
             # os.remove(temp_image_path)
 
-def run_test_suite(pdf_path: str, model_name: str = DEFAULT_MODEL, prompt: str = DEFAULT_PROMPT) -> dict:
+def test_image_session(pdf_path: str, model_name: str, prompts: list) -> list:
     """
-    Runs an image-based test on a single PDF file.
+    Tests several prompts against the same page in one multi-turn conversation.
+    The image is only sent with the first turn, so the server encodes it once and
+    keeps the shared prefix cached for the follow-up prompts.
     
-    Returns a dictionary containing the results and metadata.
+    Returns one output string per prompt, in order.
     """
-    print(f"\n--- Starting Test Suite for: {os.path.basename(pdf_path)} ---")
-    print(f"Using model: {model_name}")
+    print(f"  [TESTING] Image session ({len(prompts)} prompts) for: {pdf_path}")
+    if not os.path.exists(pdf_path):
+        return ["Error: PDF file not found."] * len(prompts)
+
+    temp_image_path = "temp_exam_page_for_testing.png"
+    
+    try:
+        image_bytes = _render_first_page(pdf_path, temp_image_path)
+        if image_bytes is None:
+            return ["Error: pdf2image failed to convert the PDF."] * len(prompts)
+        
+        outputs = []
+        messages = []
+        for prompt in prompts:
+            vision_prompt = _vision_prompt(prompt)
+            message = {'role': 'user', 'content': vision_prompt}
+            if not messages:
+                message['images'] = [image_bytes]
+            messages.append(message)
+            try:
+                response = OLLAMA_CLIENT.chat(model=model_name, messages=messages,
+                                              keep_alive=OLLAMA_KEEP_ALIVE)
+                content = response['message']['content']
+                messages.append({'role': 'assistant', 'content': content})
+                print("  [SUCCESS] Image test completed.")
+            except Exception as api_error:
+                print(f"  [WARNING] Vision API failed with {model_name}: {api_error}")
+                # Drop the unanswered turn so the session stays well formed
+                messages.pop()
+                content = _run_cli_fallback(model_name, vision_prompt, temp_image_path, api_error)
+            outputs.append(content)
+        return outputs
+
+    except Exception as e:
+        print(f"  [ERROR] An unexpected error occurred during image test: {e}")
+        return [f"Error: {e}"] * len(prompts)
+    finally:
+        if os.path.exists(temp_image_path):
+            print(f"  [INFO] Temporary image saved at {temp_image_path}")
+
+def _results_cache_path(pdf_path: str, model_name: str, prompts: list) -> str:
+    """Cache file for the model replies to prompts on this exact PDF rendered at IMAGE_DPI."""
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        digest.update(f.read())
+    # The render resolution changes what the model sees, so it is part of the key
+    digest.update(json.dumps([model_name, list(prompts), IMAGE_DPI]).encode('utf-8'))
+    return os.path.join(RESULTS_CACHE_DIR, f"{digest.hexdigest()}.json")
+
+def _cached_image_results(pdf_path: str, model_name: str, prompts: list, run) -> list:
+    """
+    Returns run() (one reply per prompt), reusing the replies stored for the same PDF
+    bytes, model and prompts. Replies containing errors are not stored.
+    """
+    if not os.path.exists(pdf_path):
+        return run()
+    cache_path = _results_cache_path(pdf_path, model_name, prompts)
+    try:
+        with open(cache_path, 'r') as f:
+            outputs = json.load(f)
+        print(f"  [CACHE] Reusing stored model replies for {pdf_path}")
+        return outputs
+    except (OSError, ValueError):
+        pass
     
+    outputs = run()
+    if not any(output.startswith("Error") for output in outputs):
+        os.makedirs(RESULTS_CACHE_DIR, exist_ok=True)
+        with open(cache_path, 'w') as f:
+            json.dump(outputs, f)
+    return outputs
+
+def warm_up_model(model_name: str = DEFAULT_MODEL) -> None:
+    """
+    Loads the model used for image tests into memory ahead of the first test.
+    An empty generate request only loads the model; failures are reported and ignored.
+    """
+    image_model = _select_image_model(model_name)
+    try:
+        OLLAMA_CLIENT.generate(model=image_model, prompt='', keep_alive=OLLAMA_KEEP_ALIVE)
+        print(f"  [INFO] Model {image_model} loaded")
+    except Exception as e:
+        print(f"  [WARNING] Could not preload {image_model}: {e}")
+
+def _select_image_model(model_name: str) -> str:
+    """Returns the model to use for image input, falling back to the default vision model."""
     # Check if the model supports vision
     is_vision_model = check_vision_capability(model_name)
     print(f"Vision capability detected for {model_name}: {is_vision_model}")
@@ -141,9 +264,12 @@ def run_test_suite(pdf_path: str, model_name: str = DEFAULT_MODEL, prompt: str =
     image_model = model_name if is_vision_model else DEFAULT_VISION_MODEL
     if image_model != model_name:
         print(f"  [INFO] Using {image_model} for image processing as {model_name} may not support vision")
-    
-    image_result = test_image_from_pdf(pdf_path, image_model, prompt)
-    
+    return image_model
+
+def _save_results(pdf_path: str, model_name: str, image_model: str, prompt: str, image_result: str) -> dict:
+    """
+    Packages a single image test output and saves it to a prompt-specific results file.
+    """
     results = {
         "pdf_variant": os.path.basename(pdf_path),
         "model_used": model_name,
@@ -158,8 +284,6 @@ def run_test_suite(pdf_path: str, model_name: str = DEFAULT_MODEL, prompt: str =
         }
     }
     
-    print(f"--- Test Suite for {os.path.basename(pdf_path)} Finished ---")
-    
     # Save the results to a file - use a prompt-specific name
     prompt_type = "transcription"
     if "solve" in prompt.lower():
@@ -180,6 +304,52 @@ def run_test_suite(pdf_path: str, model_name: str = DEFAULT_MODEL, prompt: str =
     
     return results
 
+def run_test_suite(pdf_path: str, model_name: str = DEFAULT_MODEL, prompt: str = DEFAULT_PROMPT,
+                   use_cache: bool = False) -> dict:
+    """
+    Runs an image-based test on a single PDF file.
+    With use_cache=True a reply stored for the same PDF bytes, model and prompt is reused.
+    
+    Returns a dictionary containing the results and metadata.
+    """
+    print(f"\n--- Starting Test Suite for: {os.path.basename(pdf_path)} ---")
+    print(f"Using model: {model_name}")
+    
+    image_model = _select_image_model(model_name)
+    if use_cache:
+        image_result, = _cached_image_results(pdf_path, image_model, [prompt],
+                                              lambda: [test_image_from_pdf(pdf_path, image_model, prompt)])
+    else:
+        image_result = test_image_from_pdf(pdf_path, image_model, prompt)
+    
+    print(f"--- Test Suite for {os.path.basename(pdf_path)} Finished ---")
+    
+    return _save_results(pdf_path, model_name, image_model, prompt, image_result)
+
+def run_test_suite_session(pdf_path: str, model_name: str = DEFAULT_MODEL, prompts: list = None,
+                           use_cache: bool = False) -> list:
+    """
+    Runs several prompts on a single PDF file in one model session.
+    With use_cache=True the replies stored for the same PDF bytes, model and prompts are reused.
+    
+    Returns one results dictionary per prompt, in the same order as the prompts.
+    """
+    prompts = prompts or [DEFAULT_PROMPT, SOLVE_PROMPT, EXPLAIN_PROMPT]
+    print(f"\n--- Starting Test Session for: {os.path.basename(pdf_path)} ---")
+    print(f"Using model: {model_name}")
+    
+    image_model = _select_image_model(model_name)
+    if use_cache:
+        image_results = _cached_image_results(pdf_path, image_model, prompts,
+                                              lambda: test_image_session(pdf_path, image_model, prompts))
+    else:
+        image_results = test_image_session(pdf_path, image_model, prompts)
+    
+    print(f"--- Test Session for {os.path.basename(pdf_path)} Finished ---")
+    
+    return [_save_results(pdf_path, model_name, image_model, prompt, image_result)
+            for prompt, image_result in zip(prompts, image_results)]
+
 # This block allows you to run this script directly to test a single file
 if __name__ == '__main__':
     # --- Execute the test suite ---
@@ -190,15 +360,10 @@ if __name__ == '__main__':
         print(f"Error: PDF file '{TEST_PDF}' does not exist.")
         exit(1)
     
-    # Run different prompts to get a range of outputs
-    print("\n=== RUNNING TRANSCRIPTION TEST ===")
-    transcription_results = run_test_suite(TEST_PDF, DEFAULT_MODEL, DEFAULT_PROMPT)
-    
-    print("\n=== RUNNING PROBLEM SOLVING TEST ===")
-    solving_results = run_test_suite(TEST_PDF, DEFAULT_MODEL, SOLVE_PROMPT)
-    
-    print("\n=== RUNNING EXPLANATION TEST ===")
-    explanation_results = run_test_suite(TEST_PDF, DEFAULT_MODEL, EXPLAIN_PROMPT)
+    # Run different prompts to get a range of outputs, sharing one session for the image
+    print("\n=== RUNNING TRANSCRIPTION, PROBLEM SOLVING AND EXPLANATION TESTS ===")
+    transcription_results, solving_results, explanation_results = run_test_suite_session(
+        TEST_PDF, DEFAULT_MODEL, [DEFAULT_PROMPT, SOLVE_PROMPT, EXPLAIN_PROMPT])
     
     # --- Print a summary of the results ---
     print("\n\n" + "="*20 + " TEST SUMMARY " + "="*20)
@@ -6,83 +6,49 @@ Script to generate 10 sample attack PDFs from ex1_shorter.tex for physical testi
 import os
 import sys
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Try to import the required modules
 try:
-    from exam_attack_v3 import create_exam_variant
+    from attack_specs import EX1_ATTACKS, load_attacks, cached_build
 except ImportError:
-    print("ERROR: Could not import exam_attack_v3 module. Make sure it exists in the current directory.")
+    print("ERROR: Could not import attack_specs/exam_attack_v3 modules. Make sure they exist in the current directory.")
     sys.exit(1)
 
-def generate_attack_pdfs(template_path='ex1_shorter.tex', output_dir='ex1_attack_pdfs'):
+def _build_one_attack(attack, template_path, output_dir, force=False):
+    """
+    Generate the PDF for a single attack.
+    
+    Returns:
+        tuple: (attack name, PDF path or None, error message or None)
+    """
+    print(f"\n--- Generating PDF for attack: {attack['name']} ({attack['type']}) ---")
+    
+    try:
+        # Create the attack variant
+        variant_name = f"variant_{attack['name']}"
+        variant_path = os.path.join(output_dir, variant_name)
+        
+        # cached_build only returns the path of a PDF that exists
+        pdf_path = cached_build(attack, template_path, variant_path, force=force, deps=(__file__,))
+        return attack['name'], pdf_path, None
+        
+    except Exception as e:
+        return attack['name'], None, str(e)
+
+def generate_attack_pdfs(template_path='ex1_shorter.tex', output_dir='ex1_attack_pdfs', force=False, attacks_file=None):
     """
     Generate PDFs for the top 10 most effective attacks using the ex1_shorter.tex template.
     
     Args:
         template_path (str): Path to the LaTeX template file to use as a base
         output_dir (str): Directory to save the generated PDFs
+        force (bool): Rebuild every PDF even if it is already up to date
+        attacks_file (str): JSON attack list to use instead of attacks/ex1_top10.json
     """
-    # Define the attacks to generate based on previous effectiveness
-    attacks = [
-        # Baseline (no attack) for comparison
-        {'name': 'baseline_clean', 'type': 'none', 'params': {}},
-        
-        # Attack 1: Triple threat combo attack
-        {'name': 'C4_combo_triple_threat', 'type': 'combo', 'params': {
-            'sub_attacks': [
-                {'type': 'watermark_tiled', 'params': {'text': 'DRAFT', 'color': 'gray!10', 'size': 8}},
-                {'type': 'kerning', 'params': {'amount': -0.08, 'target': 'x^2'}},
-                {'type': 'symbol_stretch', 'params': {'target': '\\int', 'stretch_amount': 1.5}}
-            ]
-        }},
-        
-        # Attack 2: Subtle symbol watermark
-        {'name': 'A1c_watermark_subtle_symbols', 'type': 'watermark_tiled', 
-         'params': {'text': r'\alpha \beta \gamma', 'color': 'gray!8', 'size': 12, 'angle': 45, 'x_step': 5, 'y_step': 4}},
-        
-        # Attack 3: Kerning with texture
-        {'name': 'B1_combo_kerning_and_dense_lines', 'type': 'combo', 'params': {
-            'sub_attacks': [
-                {'type': 'kerning', 'params': {'amount': -0.1, 'target': 'derivative'}},
-                {'type': 'texture', 'params': {'pattern': 'lines', 'density': 0.6, 'color': 'gray!15'}}
-            ]
-        }},
-        
-        # Attack 4: Light watermark
-        {'name': 'F1b_watermark_color_light', 'type': 'watermark_tiled', 
-         'params': {'text': 'DRAFT', 'color': 'gray!10', 'size': 10, 'angle': 30, 'x_step': 6, 'y_step': 5}},
-        
-        # Attack 5: Symbol stretching
-        {'name': 'S2_stretch_sum', 'type': 'symbol_stretch', 
-         'params': {'target': '\\sum', 'stretch_amount': 1.5}},
-        
-        # Attack 6: Wave pattern
-        {'name': 'OPT21_texture_tuned', 'type': 'texture', 
-         'params': {'pattern': 'wave', 'color': 'gray!18', 'density': 0.45, 'line_width': 0.25}},
-        
-        # Attack 7: Very light draft watermark
-        {'name': 'F1a_watermark_color_vlight', 'type': 'watermark_tiled', 
-         'params': {'text': 'DRAFT', 'color': 'gray!5', 'size': 10, 'angle': 30, 'x_step': 6, 'y_step': 5}},
-        
-        # Attack 8: Kitchen sink combo (multiple methods)
-        {'name': 'C1_combo_kitchen_sink', 'type': 'combo', 'params': {
-            'sub_attacks': [
-                {'type': 'watermark_tiled', 'params': {'text': 'CONFIDENTIAL', 'color': 'gray!7', 'size': 8}},
-                {'type': 'texture', 'params': {'pattern': 'dots', 'density': 0.4, 'color': 'gray!10'}},
-                {'type': 'kerning', 'params': {'amount': -0.05, 'target': 'calculus'}},
-                {'type': 'symbol_stretch', 'params': {'target': '=', 'stretch_amount': 1.2}}
-            ]
-        }},
-        
-        # Attack 9: Grid texture
-        {'name': 'O2_optimized_texture', 'type': 'texture', 
-         'params': {'pattern': 'grid', 'color': 'gray!12', 'density': 0.5, 'line_width': 0.2}},
-        
-        # Attack 10: Symbol stretching on partial derivatives
-        {'name': 'S3_stretch_partial', 'type': 'symbol_stretch', 
-         'params': {'target': '\\partial', 'stretch_amount': 1.4}}
-    ]
+    # Attack recipes are shared with the other generation scripts
+    attacks = load_attacks(attacks_file) if attacks_file else EX1_ATTACKS
     
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
@@ -91,47 +57,38 @@ def generate_attack_pdfs(template_path='ex1_shorter.tex', output_dir='ex1_attack
     print(f"Using template: {template_path}")
     print(f"Saving PDFs to: {output_dir}")
     
-    # Generate PDFs for each attack
-    for attack in attacks:
-        print(f"\n--- Generating PDF for attack: {attack['name']} ({attack['type']}) ---")
-        
-        try:
-            # Create the attack variant
-            variant_name = f"variant_{attack['name']}"
-            variant_path = os.path.join(output_dir, variant_name)
-            
-            # Create the attack variant
-            pdf_path = create_exam_variant(
-                template_path=template_path,
-                output_name=variant_path,
-                attack_params=attack
-            )
-            
-            if not pdf_path or not os.path.exists(pdf_path):
-                print(f"Error: Failed to create PDF for {variant_path}")
-                continue
-            
+    # Generate PDFs for each attack; every attack is independent, so they compile in parallel.
+    # Threads are enough: each worker mostly waits on its lualatex subprocess.
+    with ThreadPoolExecutor(max_workers=min(len(attacks), os.cpu_count() or 4)) as executor:
+        results = list(executor.map(lambda attack: _build_one_attack(attack, template_path, output_dir, force), attacks))
+    
+    for name, pdf_path, error in results:
+        if error:
+            print(f"Error with attack {name}: {error}")
+        elif pdf_path:
             print(f"Successfully generated: {pdf_path}")
-            
-        except Exception as e:
-            print(f"Error with attack {attack['name']}: {str(e)}")
+        else:
+            print(f"Error: Failed to create PDF for {name}")
     
     # Create a manifest file listing all generated PDFs and their attack types
     manifest_path = f"{output_dir}/pdf_manifest.txt"
+    parts = [
+        "Generated Attack PDFs Manifest\n",
+        f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n",
+        f"Template used: {template_path}\n",
+        "-" * 60 + "\n\n",
+    ]
+    for attack in attacks:
+        parts.append(f"File: variant_{attack['name']}.pdf\n"
+                     f"Attack Name: {attack['name']}\n"
+                     f"Attack Type: {attack['type']}\n")
+        if attack['type'] != 'none':
+            parts.append(f"Attack Parameters: {attack['params']!r}\n")
+        parts.append("\n")
+    
+    # Write the whole manifest in one call
     with open(manifest_path, 'w') as f:
-        f.write("Generated Attack PDFs Manifest\n")
-        f.write(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Template used: {template_path}\n")
-        f.write("-" * 60 + "\n\n")
-        
-        for attack in attacks:
-            pdf_name = f"variant_{attack['name']}.pdf"
-            f.write(f"File: {pdf_name}\n")
-            f.write(f"Attack Name: {attack['name']}\n")
-            f.write(f"Attack Type: {attack['type']}\n")
-            if attack['type'] != 'none':
-                f.write(f"Attack Parameters: {str(attack['params'])}\n")
-            f.write("\n")
+        f.write("".join(parts))
     
     print("\nAll PDFs generated!")
     print(f"PDFs and manifest saved to the '{output_dir}' directory")
@@ -147,6 +104,10 @@ if __name__ == "__main__":
                         help='LaTeX template file path')
     parser.add_argument('--output-dir', type=str, default='ex1_attack_pdfs',
                         help='Directory to save the generated PDFs')
+    parser.add_argument('--force', action='store_true',
+                        help='Rebuild every PDF even if it is already up to date')
+    parser.add_argument('--attacks-file', type=str, default=None,
+                        help='JSON attack list (default: attacks/ex1_top10.json)')
     
     args = parser.parse_args()
     
@@ -156,5 +117,7 @@ if __name__ == "__main__":
     else:
         generate_attack_pdfs(
             template_path=args.template,
-            output_dir=args.output_dir
+            output_dir=args.output_dir,
+            force=args.force,
+            attacks_file=args.attacks_file
         )
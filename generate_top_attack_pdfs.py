@@ -5,78 +5,120 @@ This allows for physical testing - printing the PDFs, taking photos, and testing
 """
 
 import os
+import re
+import functools
 import argparse
+import shutil
+import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Try to import the required modules
 try:
-    from exam_attack_v3 import create_exam_variant
+    from exam_attack_v3 import create_exam_variant, LUALATEX_PATH, LUALATEX_OPTIONS
+    from attack_specs import BASELINE, TOP_ATTACKS, load_attacks, cached_build
 except ImportError:
-    print("ERROR: Could not import exam_attack_v3 module. Make sure it exists in the current directory.")
+    print("ERROR: Could not import attack_specs/exam_attack_v3 modules. Make sure they exist in the current directory.")
     sys.exit(1)
 
-def generate_attack_pdfs(template_path='exam_template.tex', output_dir='attack_pdfs'):
+# Commands whose output is only right after a second LaTeX pass: references (including
+# hyperref/cleveref/varioref/nameref forms), citations (\cite and natbib's \citep, \citet, ...)
+# and the table of contents / lists of figures and tables
+CROSS_REFERENCE_RE = re.compile(r'\\(?:ref|eqref|pageref|vref|autoref|[cC]ref|[cC]pageref|nameref|label'
+                                r'|[cC]ite[a-zA-Z]*|tableofcontents|listof[a-zA-Z]+)\b')
+
+def _uses_cross_references(template_path):
+    """Check whether the template needs a second lualatex pass to resolve references."""
+    with open(template_path, 'r') as f:
+        return CROSS_REFERENCE_RE.search(f.read()) is not None
+
+def _run_lualatex(tex_path, output_dir, draft=False):
     """
-    Generate PDFs for the top 10 most effective attacks.
+    Run one lualatex pass over tex_path, discarding its console output.
+    A draft pass only updates the .aux files (no PDF is written) and stops at the first error.
     
-    Args:
-        template_path (str): Path to the LaTeX template file to use as a base
-        output_dir (str): Directory to save the generated PDFs
+    Returns:
+        bool: True if lualatex exited successfully
     """
-    # Define the top 10 attacks based on effectiveness
-    top_attacks = [
-        # Attacks that performed best for "solving" prompt type
-        {'name': 'C4_combo_triple_threat', 'type': 'combo', 'params': {
-            'attacks': [
-                {'type': 'watermark_tiled', 'params': {'text': 'DRAFT', 'color': 'gray!10', 'size': 8}},
-                {'type': 'kerning', 'params': {'amount': -0.08, 'target': 'x^2'}},
-                {'type': 'symbol_stretch', 'params': {'target': '\\int', 'stretch_amount': 1.5}}
-            ]
-        }},
-        
-        {'name': 'A1c_watermark_subtle_symbols', 'type': 'watermark_tiled', 
-         'params': {'text': r'\alpha \beta \gamma', 'color': 'gray!8', 'size': 12, 'angle': 45, 'x_step': 5, 'y_step': 4}},
-        
-        {'name': 'B1_combo_kerning_and_dense_lines', 'type': 'combo', 'params': {
-            'attacks': [
-                {'type': 'kerning', 'params': {'amount': -0.1, 'target': 'derivative'}},
-                {'type': 'texture', 'params': {'pattern': 'lines', 'density': 0.6, 'color': 'gray!15'}}
-            ]
-        }},
-        
-        {'name': 'F1b_watermark_color_light', 'type': 'watermark_tiled', 
-         'params': {'text': 'DRAFT', 'color': 'gray!10', 'size': 10, 'angle': 30, 'x_step': 6, 'y_step': 5}},
-        
-        {'name': 'S2_stretch_sum', 'type': 'symbol_stretch', 
-         'params': {'target': '\\sum', 'stretch_amount': 1.5}},
-        
-        {'name': 'M3_fraktur_operators', 'type': 'math_font', 
-         'params': {'target_type': 'operators', 'font_style': '\\mathfrak'}},
-        
-        {'name': 'O2_optimized_texture', 'type': 'texture', 
-         'params': {'pattern': 'grid', 'color': 'gray!12', 'density': 0.5, 'line_width': 0.2}},
+    if draft:
+        cmd = [LUALATEX_PATH, *LUALATEX_OPTIONS, '-interaction=batchmode', '-halt-on-error', '-draftmode']
+    else:
+        cmd = [LUALATEX_PATH, *LUALATEX_OPTIONS, '-interaction=nonstopmode']
+    cmd += [f'-output-directory={output_dir}', tex_path]
+    return subprocess.run(cmd, check=False, stdout=subprocess.DEVNULL).returncode == 0
+
+def _compile_attack(attack, template_path, variant_name, needs_rerun=True):
+    """
+    Write and compile variant_name.tex for a single attack.
+    needs_rerun adds a draft pass before the final one for templates with cross-references.
+    
+    Returns:
+        str or None: Path to the PDF, or None if a lualatex pass failed
+    """
+    output_dir = os.path.dirname(variant_name)
+    variant_filename = f"{variant_name}.tex"
+    pdf_path = f"{variant_name}.pdf"
+    
+    if attack['type'] == 'none':
+        # Just copy the template for baseline (kernel-side copy, no read/write round trip)
+        shutil.copyfile(template_path, variant_filename)
         
-        # Attacks that had some positive effectiveness
-        {'name': 'OPT21_texture_tuned', 'type': 'texture', 
-         'params': {'pattern': 'wave', 'color': 'gray!18', 'density': 0.45, 'line_width': 0.25}},
+        # Compile the LaTeX file
+        print(f"Compiling {variant_filename}...")
+        if needs_rerun and not _run_lualatex(variant_filename, output_dir, draft=True):
+            return None
+        return pdf_path if _run_lualatex(variant_filename, output_dir) else None
+    
+    # Create and compile the attack variant (create_exam_variant appends .tex itself);
+    # with cross-references the first pass is a draft that only fills the .aux files
+    result = create_exam_variant(
+        template_path=template_path,
+        output_name=variant_name,
+        attack_params=attack,
+        draft=needs_rerun
+    )
+    if result is None:
+        return None
+    if needs_rerun:
+        return pdf_path if _run_lualatex(variant_filename, output_dir) else None
+    return result
+
+def _build_one_attack(attack, template_path, output_dir, needs_rerun=True, force=False):
+    """
+    Generate the PDF for a single attack, reusing a cached build when nothing changed.
+    
+    Returns:
+        tuple: (attack name, PDF path or None, error message or None)
+    """
+    print(f"\n--- Generating PDF for attack: {attack['name']} ({attack['type']}) ---")
+    
+    try:
+        # Make sure we don't add .tex twice
+        attack_name_clean = attack['name'].replace('.tex', '')
+        variant_name = os.path.join(output_dir, f"variant_{attack_name_clean}")
         
-        {'name': 'F1a_watermark_color_vlight', 'type': 'watermark_tiled', 
-         'params': {'text': 'DRAFT', 'color': 'gray!5', 'size': 10, 'angle': 30, 'x_step': 6, 'y_step': 5}},
+        pdf_path = cached_build(attack, template_path, variant_name,
+                                build=functools.partial(_compile_attack, needs_rerun=needs_rerun),
+                                force=force, deps=(__file__,),
+                                build_id=f"generate_top_attack_pdfs:{2 if needs_rerun else 1}-pass")
+        return attack['name'], pdf_path, None
         
-        {'name': 'C1_combo_kitchen_sink', 'type': 'combo', 'params': {
-            'attacks': [
-                {'type': 'watermark_tiled', 'params': {'text': 'CONFIDENTIAL', 'color': 'gray!7', 'size': 8}},
-                {'type': 'texture', 'params': {'pattern': 'dots', 'density': 0.4, 'color': 'gray!10'}},
-                {'type': 'kerning', 'params': {'amount': -0.05, 'target': 'calculus'}},
-                {'type': 'symbol_stretch', 'params': {'target': '=', 'stretch_amount': 1.2}}
-            ]
-        }}
-    ]
+    except Exception as e:
+        return attack['name'], None, str(e)
+
+def generate_attack_pdfs(template_path='exam_template.tex', output_dir='attack_pdfs', force=False, attacks_file=None):
+    """
+    Generate PDFs for the top 10 most effective attacks.
     
-    # Add the baseline for comparison
-    baseline = {'name': 'baseline_clean', 'type': 'none', 'params': {}}
-    all_attacks = [baseline] + top_attacks
+    Args:
+        template_path (str): Path to the LaTeX template file to use as a base
+        output_dir (str): Directory to save the generated PDFs
+        force (bool): Rebuild every PDF even if it is already up to date
+        attacks_file (str): JSON attack list to use instead of attacks/top10.json (the baseline is always added)
+    """
+    # Attack recipes are shared with the other generation scripts
+    all_attacks = [BASELINE] + (load_attacks(attacks_file) if attacks_file else TOP_ATTACKS)
     
     # Create output directory
     os.makedirs(output_dir, exist_ok=True)
@@ -85,65 +127,39 @@ def generate_attack_pdfs(template_path='exam_template.tex', output_dir='attack_p
     print(f"Using template: {template_path}")
     print(f"Saving PDFs to: {output_dir}")
     
-    # Generate PDFs for each attack
-    for attack in all_attacks:
-        print(f"\n--- Generating PDF for attack: {attack['name']} ({attack['type']}) ---")
-        
-        try:
-            # Create the attack variant
-            # Make sure we don't add .tex twice
-            attack_name_clean = attack['name'].replace('.tex', '')
-            variant_filename = f"{output_dir}/variant_{attack_name_clean}.tex"
-            pdf_path = os.path.splitext(variant_filename)[0] + ".pdf"
-            
-            if attack['type'] == 'none':
-                # Just copy the template for baseline
-                with open(template_path, 'r') as f:
-                    template_content = f.read()
-                
-                with open(variant_filename, 'w') as f:
-                    f.write(template_content)
-            else:
-                # Create the attack variant
-                create_exam_variant(
-                    template_path=template_path,
-                    output_name=variant_filename,
-                    attack_params=attack
-                )
-            
-            # Compile the LaTeX file
-            print(f"Compiling {variant_filename}...")
-            compile_cmd = f"lualatex -interaction=nonstopmode -output-directory={output_dir} {variant_filename}"
-            os.system(compile_cmd)
-            
-            # Run twice for proper cross-references
-            os.system(compile_cmd)
-            
-            if not os.path.exists(pdf_path):
-                print(f"Error: Failed to create PDF for {variant_filename}")
-                continue
-            
+    # Generate PDFs for each attack; every attack is independent, so they compile in parallel.
+    # Threads are enough: each worker mostly waits on its lualatex subprocess.
+    needs_rerun = _uses_cross_references(template_path)
+    with ThreadPoolExecutor(max_workers=min(len(all_attacks), os.cpu_count() or 4)) as executor:
+        results = list(executor.map(lambda attack: _build_one_attack(attack, template_path, output_dir, needs_rerun, force), all_attacks))
+    
+    for name, pdf_path, error in results:
+        if error:
+            print(f"Error with attack {name}: {error}")
+        elif pdf_path:
             print(f"Successfully generated: {pdf_path}")
-            
-        except Exception as e:
-            print(f"Error with attack {attack['name']}: {str(e)}")
+        else:
+            print(f"Error: Failed to create PDF for {name}")
     
     # Create a manifest file listing all generated PDFs and their attack types
     manifest_path = f"{output_dir}/pdf_manifest.txt"
+    parts = [
+        "Generated Attack PDFs Manifest\n",
+        f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n",
+        f"Template used: {template_path}\n",
+        "-" * 60 + "\n\n",
+    ]
+    for attack in all_attacks:
+        parts.append(f"File: variant_{attack['name']}.pdf\n"
+                     f"Attack Name: {attack['name']}\n"
+                     f"Attack Type: {attack['type']}\n")
+        if attack['type'] != 'none':
+            parts.append(f"Attack Parameters: {attack['params']!r}\n")
+        parts.append("\n")
+    
+    # Write the whole manifest in one call
     with open(manifest_path, 'w') as f:
-        f.write("Generated Attack PDFs Manifest\n")
-        f.write(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Template used: {template_path}\n")
-        f.write("-" * 60 + "\n\n")
-        
-        for attack in all_attacks:
-            pdf_name = f"variant_{attack['name']}.pdf"
-            f.write(f"File: {pdf_name}\n")
-            f.write(f"Attack Name: {attack['name']}\n")
-            f.write(f"Attack Type: {attack['type']}\n")
-            if attack['type'] != 'none':
-                f.write(f"Attack Parameters: {str(attack['params'])}\n")
-            f.write("\n")
+        f.write("".join(parts))
     
     print("\nAll PDFs generated!")
     print(f"PDFs and manifest saved to the '{output_dir}' directory")
@@ -159,6 +175,10 @@ if __name__ == "__main__":
                         help='LaTeX template file path')
     parser.add_argument('--output-dir', type=str, default='attack_pdfs',
                         help='Directory to save the generated PDFs')
+    parser.add_argument('--force', action='store_true',
+                        help='Rebuild every PDF even if it is already up to date')
+    parser.add_argument('--attacks-file', type=str, default=None,
+                        help='JSON attack list (default: attacks/top10.json)')
     
     args = parser.parse_args()
     
@@ -167,5 +187,7 @@ if __name__ == "__main__":
     else:
         generate_attack_pdfs(
             template_path=args.template,
-            output_dir=args.output_dir
+            output_dir=args.output_dir,
+            force=args.force,
+            attacks_file=args.attacks_file
         )
@@ -10,28 +10,124 @@ import json
 import argparse
 import sys
 import shutil
+import subprocess
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 # Try to import the required modules
 try:
-    from exam_attack_v3 import create_exam_variant
+    from exam_attack_v3 import create_exam_variant, link_or_copy, LUALATEX_PATH, LUALATEX_OPTIONS
+    from attack_specs import BASELINE, TOP_ATTACKS, cached_build
 except ImportError:
-    print("ERROR: Could not import exam_attack_v3 module. Make sure it exists in the current directory.")
+    print("ERROR: Could not import exam_attack_v3/attack_specs modules. Make sure they exist in the current directory.")
     sys.exit(1)
 
 try:
-    from exam_test import run_test_suite, DEFAULT_PROMPT, SOLVE_PROMPT, EXPLAIN_PROMPT
+    from exam_test import run_test_suite_session, warm_up_model, DEFAULT_PROMPT, SOLVE_PROMPT, EXPLAIN_PROMPT
 except ImportError:
     print("ERROR: Could not import exam_test module. Make sure it exists in the current directory.")
     print("Using default prompts instead.")
     DEFAULT_PROMPT = "Transcribe the text from the document."
     SOLVE_PROMPT = "Identify the main math or coding problem in this document and solve it. Show your work and explain your solution."
     EXPLAIN_PROMPT = "Explain the concept being tested in this document and provide a detailed explanation of the problem and solution."
+    warm_up_model = None
+
+# The baseline goes first for comparison; recipes are shared with the generate scripts
+ALL_ATTACKS = (BASELINE, *TOP_ATTACKS)
+
+# Prompt types to test, as (name, prompt) pairs in session order
+PROMPT_TYPES = (
+    ("transcription", DEFAULT_PROMPT),
+    ("solving", SOLVE_PROMPT),
+    ("explanation", EXPLAIN_PROMPT),
+)
+PROMPT_NAMES = tuple(name for name, _ in PROMPT_TYPES)
+PROMPT_TEXTS = [prompt for _, prompt in PROMPT_TYPES]
+
+# orjson is optional; it serializes log entries several times faster than the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _encode_log_entry(entry):
+    """Encode one log entry as a UTF-8 JSONL line."""
+    if orjson is not None:
+        return orjson.dumps(entry) + b'\n'
+    return json.dumps(entry).encode('utf-8') + b'\n'
+
+def _link_resource_dirs(template_path, output_dir):
+    """Link (or copy) the figure directories the templates use next to the variants."""
+    dirname = os.path.dirname(template_path)
+    if dirname != output_dir and dirname != '':
+        # List of possible resource directories used in templates
+        resource_dirs = [
+            "CoF AI paper exam 4 (Discrete math)",
+            "CoF AI paper exam 2 (Multivariable calculus)",
+            "CoF AI paper exam 3 (Complex analysis)",
+            "CoF AI paper exam"
+        ]
+        
+        for resource_dir in resource_dirs:
+            src_dir = os.path.join(os.path.abspath(dirname or '.'), resource_dir)
+            dst_dir = os.path.join(os.path.abspath(output_dir), resource_dir)
+            
+            if os.path.exists(src_dir) and not os.path.exists(dst_dir):
+                print(f"Creating symbolic link from {src_dir} to {dst_dir}")
+                try:
+                    os.symlink(src_dir, dst_dir)
+                except OSError as e:
+                    # If symlink fails (e.g. on some Windows systems), mirror the tree with
+                    # hardlinks so no file contents are duplicated
+                    print(f"Symlink failed: {e}. Attempting to hardlink the directory tree.")
+                    if os.path.isdir(src_dir):
+                        shutil.copytree(src_dir, dst_dir, copy_function=link_or_copy)
+
+def _compile_variant(attack, template_path, variant_name):
+    """
+    Write and compile variant_name.tex for one attack.
+    
+    Returns:
+        str or None: Path to the PDF, or None if the compile failed
+    """
+    variant_filename = f"{variant_name}.tex"
+    pdf_path = f"{variant_name}.pdf"
+    
+    if attack['type'] == 'none':
+        # Just copy the template for baseline, then compile it (no shell in between)
+        shutil.copyfile(template_path, variant_filename)
+        print(f"Compiling {variant_filename}...")
+        process = subprocess.run([LUALATEX_PATH, *LUALATEX_OPTIONS, '-interaction=nonstopmode',
+                                  f'-output-directory={os.path.dirname(variant_name) or "."}',
+                                  variant_filename], check=False, stdout=subprocess.DEVNULL)
+        return pdf_path if process.returncode == 0 else None
+    
+    # Create and compile the attack variant (create_exam_variant appends .tex itself)
+    return create_exam_variant(
+        template_path=template_path,
+        output_name=variant_name,
+        attack_params=attack
+    )
+
+def _build_attack_pdf(attack, template_path, output_dir, force=False):
+    """
+    Build the PDF for one attack, reusing a cached build when nothing changed.
+    
+    Returns:
+        str or None: Path to the PDF, or None if it could not be created
+    """
+    variant_name = os.path.join(output_dir, f"variant_{attack['name']}")
+    return cached_build(attack, template_path, variant_name, build=_compile_variant,
+                        force=force, deps=(__file__,), build_id='run_top_attacks:1-pass')
 
 def run_top_attacks(template_path='exam_template.tex', 
                    log_file='top_attacks_results.jsonl',
                    model_name='gemma3:4b',
-                   output_dir='attack_pdfs_0712'):
+                   output_dir='attack_pdfs_0712',
+                   force=False,
+                   reuse_results=False):
     """
     Run the top 10 most effective attacks based on previous experiment results.
     
@@ -40,65 +136,13 @@ def run_top_attacks(template_path='exam_template.tex',
         log_file (str): Path where the experiment results will be logged in JSONL format
         model_name (str): Name of the AI model to test against
         output_dir (str): Directory to store output PDFs
+        force (bool): Rebuild every PDF even if it is already up to date
+        reuse_results (bool): Reuse model replies stored for identical PDFs, model and prompts
     """
     # Create output directory if it doesn't exist
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
         
-    # Define the top 10 attacks based on effectiveness
-    top_attacks = [
-        # Attacks that performed best for "solving" prompt type
-        {'name': 'C4_combo_triple_threat', 'type': 'combo', 'params': {
-            'attacks': [
-                {'type': 'watermark_tiled', 'params': {'text': 'DRAFT', 'color': 'gray!10', 'size': 8}},
-                {'type': 'kerning', 'params': {'amount': -0.08, 'target': 'x^2'}},
-                {'type': 'symbol_stretch', 'params': {'target': '\\int', 'stretch_amount': 1.5}}
-            ]
-        }},
-        
-        {'name': 'A1c_watermark_subtle_symbols', 'type': 'watermark_tiled', 
-         'params': {'text': r'\alpha \beta \gamma', 'color': 'gray!8', 'size': 12, 'angle': 45, 'x_step': 5, 'y_step': 4}},
-        
-        {'name': 'B1_combo_kerning_and_dense_lines', 'type': 'combo', 'params': {
-            'attacks': [
-                {'type': 'kerning', 'params': {'amount': -0.1, 'target': 'derivative'}},
-                {'type': 'texture', 'params': {'pattern': 'lines', 'density': 0.6, 'color': 'gray!15'}}
-            ]
-        }},
-        
-        {'name': 'F1b_watermark_color_light', 'type': 'watermark_tiled', 
-         'params': {'text': 'DRAFT', 'color': 'gray!10', 'size': 10, 'angle': 30, 'x_step': 6, 'y_step': 5}},
-        
-        {'name': 'S2_stretch_sum', 'type': 'symbol_stretch', 
-         'params': {'target': '\\sum', 'stretch_amount': 1.5}},
-        
-        {'name': 'M3_fraktur_operators', 'type': 'math_font', 
-         'params': {'target_type': 'operators', 'font_style': '\\mathfrak'}},
-        
-        {'name': 'O2_optimized_texture', 'type': 'texture', 
-         'params': {'pattern': 'grid', 'color': 'gray!40', 'density': 0.6, 'line_width': 0.4}},
-        
-        # Attacks that had some positive effectiveness
-        {'name': 'OPT21_texture_tuned', 'type': 'texture', 
-         'params': {'pattern': 'wave', 'color': 'gray!18', 'density': 0.45, 'line_width': 0.25}},
-        
-        {'name': 'F1a_watermark_color_vlight', 'type': 'watermark_tiled', 
-         'params': {'text': 'DRAFT', 'color': 'gray!5', 'size': 10, 'angle': 30, 'x_step': 6, 'y_step': 5}},
-        
-        {'name': 'C1_combo_kitchen_sink', 'type': 'combo', 'params': {
-            'attacks': [
-                {'type': 'watermark_tiled', 'params': {'text': 'CONFIDENTIAL', 'color': 'gray!7', 'size': 8}},
-                {'type': 'texture', 'params': {'pattern': 'dots', 'density': 0.4, 'color': 'gray!10'}},
-                {'type': 'kerning', 'params': {'amount': -0.05, 'target': 'calculus'}},
-                {'type': 'symbol_stretch', 'params': {'target': '=', 'stretch_amount': 1.2}}
-            ]
-        }}
-    ]
-    
-    # Add the baseline for comparison
-    baseline = {'name': 'baseline_clean', 'type': 'none', 'params': {}}
-    all_attacks = [baseline] + top_attacks
-    
     # Create a log file and record setup
     os.makedirs(os.path.dirname(log_file) if os.path.dirname(log_file) else '.', exist_ok=True)
     
@@ -108,106 +152,88 @@ def run_top_attacks(template_path='exam_template.tex',
     print(f"Results will be logged to: {log_file}")
     print(f"PDFs will be saved to: {output_dir}")
     
-    # Define prompt types to test
-    prompt_types = [
-        {"name": "transcription", "prompt": DEFAULT_PROMPT},
-        {"name": "solving", "prompt": SOLVE_PROMPT},
-        {"name": "explanation", "prompt": EXPLAIN_PROMPT}
-    ]
+    # Resource directories are linked once; every variant is compiled into output_dir
+    _link_resource_dirs(template_path, output_dir)
     
-    # Run all combinations of attacks and prompt types
-    for attack in all_attacks:
-        print(f"\n--- Running attack: {attack['name']} ({attack['type']}) ---")
-        
+    # Build PDFs on a producer thread while the consumer loop below tests them, so
+    # lualatex and the model run at the same time. The variants are independent, so the
+    # producer compiles several at once and hands them over in attack order.
+    built = queue.Queue()
+    
+    def build(attack):
+        print(f"\n--- Building attack: {attack['name']} ({attack['type']}) ---")
         try:
-            # Create the attack variant
-            variant_filename = os.path.join(output_dir, f"variant_{attack['name']}.tex")
-            pdf_path = os.path.splitext(variant_filename)[0] + ".pdf"
+            return attack, _build_attack_pdf(attack, template_path, output_dir, force), None
+        except Exception as e:
+            return attack, None, e
+    
+    def produce():
+        with ThreadPoolExecutor(max_workers=min(len(ALL_ATTACKS), os.cpu_count() or 4)) as executor:
+            for item in executor.map(build, ALL_ATTACKS):
+                built.put(item)
+        built.put(None)
+    
+    threading.Thread(target=produce, daemon=True).start()
+    
+    # Load the model while the first PDFs compile, so the first test doesn't pay for it
+    if warm_up_model is not None:
+        warm_up_model(model_name)
+    
+    # Run all combinations of attacks and prompt types
+    # One buffered handle for the whole run, flushed after each attack
+    with open(log_file, 'ab', buffering=1 << 16) as log_f:
+        while (item := built.get()) is not None:
+            attack, pdf_path, error = item
+            print(f"\n--- Running attack: {attack['name']} ({attack['type']}) ---")
             
-            if attack['type'] == 'none':
-                # Just copy the template for baseline
-                with open(template_path, 'r') as f:
-                    template_content = f.read()
+            try:
+                if error is not None:
+                    raise error
                 
-                with open(variant_filename, 'w') as f:
-                    f.write(template_content)
-            else:
-                # Create the attack variant
-                create_exam_variant(
-                    template_path=template_path,
-                    output_name=variant_filename,
-                    attack_params=attack
-                )
-            
-            # Copy all resource directories needed for figures
-            dirname = os.path.dirname(template_path)
-            if dirname != output_dir and dirname != '':
-                # List of possible resource directories used in templates
-                resource_dirs = [
-                    "CoF AI paper exam 4 (Discrete math)",
-                    "CoF AI paper exam 2 (Multivariable calculus)",
-                    "CoF AI paper exam 3 (Complex analysis)",
-                    "CoF AI paper exam"
-                ]
+                if not pdf_path:
+                    variant_filename = os.path.join(output_dir, f"variant_{attack['name']}.tex")
+                    print(f"Error: Failed to create PDF for {variant_filename}")
+                    continue
+                
+                # Test all prompt types in one model session, so the page image is sent once
+                print(f"Testing with {', '.join(PROMPT_NAMES)} prompts...")
+                session_results = run_test_suite_session(pdf_path, model_name, PROMPT_TEXTS,
+                                                         use_cache=reuse_results)
                 
-                for resource_dir in resource_dirs:
-                    src_dir = os.path.join(os.path.abspath(dirname or '.'), resource_dir)
-                    dst_dir = os.path.join(os.path.abspath(output_dir), resource_dir)
+                # The prompts finish together in one session, so they share one timestamp
+                timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                for prompt_name, results in zip(PROMPT_NAMES, session_results):
+                    # Add metadata
+                    entry = {
+                        "attack_details": attack,
+                        "context_level": 2,
+                        "prompt_type": prompt_name,
+                        "model": model_name,
+                        "test_run_output": results,
+                        "status": "success",
+                        "timestamp": timestamp
+                    }
                     
-                    if os.path.exists(src_dir) and not os.path.exists(dst_dir):
-                        print(f"Creating symbolic link from {src_dir} to {dst_dir}")
-                        try:
-                            os.symlink(src_dir, dst_dir)
-                        except OSError as e:
-                            # If symlink fails (e.g. on some Windows systems), try copying
-                            print(f"Symlink failed: {e}. Attempting to copy directory.")
-                            if os.path.isdir(src_dir):
-                                shutil.copytree(src_dir, dst_dir)
-            
-            # Compile the LaTeX file with output directory specified
-            print(f"Compiling {variant_filename}...")
-            os.system(f"lualatex -interaction=nonstopmode -output-directory={output_dir} {variant_filename}")
-            
-            if not os.path.exists(pdf_path):
-                print(f"Error: Failed to create PDF for {variant_filename}")
-                continue
-            
-            # Test each prompt type
-            for pt in prompt_types:
-                print(f"Testing with {pt['name']} prompt...")
+                    # Log the results
+                    log_f.write(_encode_log_entry(entry))
                 
-                results = run_test_suite(pdf_path, model_name, pt['prompt'])
+            except Exception as e:
+                print(f"Error with attack {attack['name']}: {str(e)}")
                 
-                # Add metadata
-                entry = {
+                # Log the error
+                error_entry = {
                     "attack_details": attack,
                     "context_level": 2,
-                    "prompt_type": pt["name"],
                     "model": model_name,
-                    "test_run_output": results,
-                    "status": "success",
+                    "status": "error",
+                    "error": str(e),
                     "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 }
                 
-                # Log the results
-                with open(log_file, 'a') as f:
-                    f.write(json.dumps(entry) + '\n')
-            
-        except Exception as e:
-            print(f"Error with attack {attack['name']}: {str(e)}")
-            
-            # Log the error
-            error_entry = {
-                "attack_details": attack,
-                "context_level": 2,
-                "model": model_name,
-                "status": "error",
-                "error": str(e),
-                "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
+                log_f.write(_encode_log_entry(error_entry))
             
-            with open(log_file, 'a') as f:
-                f.write(json.dumps(error_entry) + '\n')
+            # Make this attack's entries durable before starting the next one
+            log_f.flush()
     
     print("\nAll attacks completed!")
     print(f"Results have been logged to {log_file}")
@@ -224,6 +250,10 @@ if __name__ == "__main__":
                         help='AI model to use for testing')
     parser.add_argument('--output-dir', type=str, default='attack_pdfs_0712',
                         help='Directory to store output PDFs')
+    parser.add_argument('--force', action='store_true',
+                        help='Rebuild every PDF even if it is already up to date')
+    parser.add_argument('--reuse-results', action='store_true',
+                        help='Reuse model replies stored in .llm_cache for unchanged PDFs')
     
     args = parser.parse_args()
     
@@ -234,5 +264,7 @@ if __name__ == "__main__":
             template_path=args.template,
             log_file=args.log_file,
             model_name=args.model,
-            output_dir=args.output_dir
+            output_dir=args.output_dir,
+            force=args.force,
+            reuse_results=args.reuse_results
         )
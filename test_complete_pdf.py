@@ -6,7 +6,7 @@ A test script to verify that the complete template is being used in the generate
 import os
 import sys
 import shutil
-from exam_attack_v3 import create_exam_variant
+from exam_attack_v3 import create_exam_variant, link_or_copy
 
 def test_complete_pdf(template_path='ex1_shorter.tex', 
                      output_dir='test_pdf_output'):
@@ -50,7 +50,7 @@ def test_complete_pdf(template_path='ex1_shorter.tex',
                 # If symlink fails, try copying
                 print(f"Symlink failed: {e}. Attempting to copy directory.")
                 if os.path.isdir(src_dir):
-                    shutil.copytree(src_dir, dst_dir)
+                    shutil.copytree(src_dir, dst_dir, copy_function=link_or_copy)
     
     # Create the attack variant
     output_path = os.path.join(output_dir, 'test_complete_template')
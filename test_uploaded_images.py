@@ -5,21 +5,29 @@ This allows for physical testing - analyzing photos of printed attack pages.
 """
 
 import os
+import re
 import json
 import argparse
 import sys
 from datetime import datetime
-import glob
 
 # Try to import the required modules
 try:
-    from exam_test import test_image_from_pdf, run_test_suite, DEFAULT_PROMPT, SOLVE_PROMPT, EXPLAIN_PROMPT
+    from exam_test import run_test_suite_session, DEFAULT_PROMPT, SOLVE_PROMPT, EXPLAIN_PROMPT
 except ImportError:
     print("ERROR: Could not import exam_test module. Make sure it exists in the current directory.")
     sys.exit(1)
-    
+
+# Uploaded photos/scans picked up from the images directory
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+# One entry of the pdf_manifest.txt written by the generate_*_attack_pdfs scripts
+MANIFEST_ENTRY_RE = re.compile(r'^File:[ \t]*(.+?)[ \t]*\n'
+                               r'Attack Name:[ \t]*(.+?)[ \t]*\n'
+                               r'Attack Type:[ \t]*(.+?)[ \t]*$', re.M)
+
 def test_uploaded_images(images_dir='attack_images', output_file='physical_test_results.jsonl', 
-                        model_name='gemma3:4b', manifest_file=None):
+                        model_name='gemma3:4b', manifest_file=None, reuse_results=False):
     """
     Test uploaded images of printed attack PDFs against an AI model.
     
@@ -28,12 +36,13 @@ def test_uploaded_images(images_dir='attack_images', output_file='physical_test_
         output_file (str): Path where the test results will be logged in JSONL format
         model_name (str): Name of the AI model to test against
         manifest_file (str): Optional path to a manifest file mapping image names to attack types
+        reuse_results (bool): Reuse model replies stored for the same image bytes, model and prompts
     """
-    # Find all images in the specified directory
-    image_extensions = ['*.jpg', '*.jpeg', '*.png']
-    images = []
-    for ext in image_extensions:
-        images.extend(glob.glob(os.path.join(images_dir, ext)))
+    # Find all images in the specified directory (one listing, in a stable order; hidden
+    # files are skipped like glob did)
+    images = sorted(entry.path for entry in os.scandir(images_dir)
+                    if entry.is_file() and not entry.name.startswith('.')
+                    and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS)
     
     if not images:
         print(f"No images found in directory: {images_dir}")
@@ -45,34 +54,10 @@ def test_uploaded_images(images_dir='attack_images', output_file='physical_test_
     if manifest_file and os.path.exists(manifest_file):
         print(f"Loading attack details from manifest: {manifest_file}")
         with open(manifest_file, 'r') as f:
-            lines = f.readlines()
-            
-            current_file = None
-            current_attack = {}
-            
-            for line in lines:
-                line = line.strip()
-                if not line or line.startswith('-'):
-                    continue
-                    
-                if line.startswith('File:'):
-                    # Save previous entry if exists
-                    if current_file and current_attack:
-                        base_name = os.path.splitext(current_file)[0]
-                        attack_mapping[base_name] = current_attack
-                    
-                    # Start new entry
-                    current_file = line.replace('File:', '').strip()
-                    current_attack = {}
-                elif line.startswith('Attack Name:'):
-                    current_attack['name'] = line.replace('Attack Name:', '').strip()
-                elif line.startswith('Attack Type:'):
-                    current_attack['type'] = line.replace('Attack Type:', '').strip()
-            
-            # Save the last entry
-            if current_file and current_attack:
-                base_name = os.path.splitext(current_file)[0]
-                attack_mapping[base_name] = current_attack
+            manifest = f.read()
+        for match in MANIFEST_ENTRY_RE.finditer(manifest):
+            base_name = os.path.splitext(match.group(1))[0]
+            attack_mapping[base_name] = {'name': match.group(2), 'type': match.group(3)}
     
     # Create output directory if it doesn't exist
     os.makedirs(os.path.dirname(output_file) if os.path.dirname(output_file) else '.', exist_ok=True)
@@ -95,44 +80,50 @@ def test_uploaded_images(images_dir='attack_images', output_file='physical_test_
         
         print(f"\n--- Testing image: {image_name} ---")
         
-        # Try to match with manifest
-        attack_details = None
-        for key in attack_mapping:
-            if key in image_base or image_base in key:
-                attack_details = attack_mapping[key]
-                print(f"Matched image to attack: {attack_details['name']} ({attack_details['type']})")
-                break
-        
-        if not attack_details:
+        # Try to match with manifest: an exact name first, then a substring match either way
+        attack_details = attack_mapping.get(image_base)
+        if attack_details is None:
+            key = next((key for key in attack_mapping if key in image_base or image_base in key), None)
+            attack_details = attack_mapping.get(key)
+        if attack_details:
+            print(f"Matched image to attack: {attack_details['name']} ({attack_details['type']})")
+        else:
             print(f"No attack mapping found for {image_name}. Using filename as identifier.")
             attack_details = {
                 'name': image_base,
                 'type': 'unknown'
             }
         
-        for pt in prompt_types:
-            print(f"Testing with {pt['name']} prompt...")
+        # All prompts share one model session, so the image is only encoded once;
+        # the session also writes the per-prompt results_<image>_<prompt>.txt files
+        print(f"Testing with {', '.join(pt['name'] for pt in prompt_types)} prompts...")
+        try:
+            session_results = run_test_suite_session(image_path, model_name,
+                                                     [pt['prompt'] for pt in prompt_types],
+                                                     use_cache=reuse_results)
+        except Exception as e:
+            print(f"Error testing image {image_name}: {str(e)}")
             
-            try:
-                # Test the image
-                image_result = test_image_from_pdf(image_path, model_name, pt['prompt'])
-                
-                # Prepare results
-                results = {
-                    "pdf_variant": image_name,
-                    "model_used": model_name,
-                    "image_model_used": model_name,
-                    "prompt": pt['prompt'],
-                    "test_results": {
-                        "image_input": image_result
-                    },
-                    "analysis": {
-                        "image_test_failed": "Error:" in image_result,
-                        "image_output_length": len(image_result)
+            # Log the error once per prompt type
+            with open(output_file, 'a') as f:
+                for pt in prompt_types:
+                    error_entry = {
+                        "attack_details": attack_details,
+                        "context_level": 2,
+                        "prompt_type": pt["name"],
+                        "model": model_name,
+                        "status": "error",
+                        "error": str(e),
+                        "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                        "physical_test": True,
+                        "image_path": image_path
                     }
-                }
-                
-                # Add metadata
+                    f.write(json.dumps(error_entry) + '\n')
+            continue
+        
+        # Log the results
+        with open(output_file, 'a') as f:
+            for pt, results in zip(prompt_types, session_results):
                 entry = {
                     "attack_details": attack_details,
                     "context_level": 2,
@@ -144,39 +135,7 @@ def test_uploaded_images(images_dir='attack_images', output_file='physical_test_
                     "physical_test": True,
                     "image_path": image_path
                 }
-                
-                # Save results to a dedicated file for this image
-                results_filename = f"results_{image_base}_{pt['name']}.txt"
-                with open(results_filename, "w") as f:
-                    f.write(f"Test Results for {image_path}\n")
-                    f.write(f"Model: {model_name}\n")
-                    f.write(f"Prompt: {pt['prompt']}\n")
-                    f.write("-" * 50 + "\n\n")
-                    f.write("IMAGE ANALYSIS RESULTS:\n\n")
-                    f.write(image_result)
-                
-                # Log the results
-                with open(output_file, 'a') as f:
-                    f.write(json.dumps(entry) + '\n')
-                    
-            except Exception as e:
-                print(f"Error testing image {image_name} with {pt['name']} prompt: {str(e)}")
-                
-                # Log the error
-                error_entry = {
-                    "attack_details": attack_details,
-                    "context_level": 2,
-                    "prompt_type": pt["name"],
-                    "model": model_name,
-                    "status": "error",
-                    "error": str(e),
-                    "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    "physical_test": True,
-                    "image_path": image_path
-                }
-                
-                with open(output_file, 'a') as f:
-                    f.write(json.dumps(error_entry) + '\n')
+                f.write(json.dumps(entry) + '\n')
     
     print("\nAll image tests completed!")
     print(f"Results have been logged to {output_file}")
@@ -192,6 +151,8 @@ if __name__ == "__main__":
                         help='AI model to use for testing')
     parser.add_argument('--manifest', type=str, default='attack_pdfs/pdf_manifest.txt',
                         help='Path to a manifest file mapping image names to attack types')
+    parser.add_argument('--reuse-results', action='store_true',
+                        help='Reuse model replies stored in .llm_cache for unchanged images')
     
     args = parser.parse_args()
     
@@ -204,5 +165,6 @@ if __name__ == "__main__":
             images_dir=args.images_dir,
             output_file=args.output_file,
             model_name=args.model,
-            manifest_file=args.manifest
+            manifest_file=args.manifest,
+            reuse_results=args.reuse_results
         )